@@ -1,7 +1,8 @@
 from flask import Flask
 from flask_login import LoginManager
 from config import Config
-from models import db, User
+from user_cache import user_cache
+from models import db, configure_engine, add_missing_columns
 import os
 
 # Criar aplicação Flask
@@ -19,17 +20,48 @@ login_manager.login_message_category = 'info'
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# User loader para Flask-Login
+# User loader para Flask-Login (cópia em cache, sem query na maioria dos pedidos)
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id))
 
 # Registar blueprints
 from auth import auth_bp
 from routes import main_bp
+from uploads import uploads_bp
+from metrics import metrics_bp, init_metrics
+from assets import assets_bp, init_assets
+from bulk import contents_cli
+from tiles import tiles_bp
 
 app.register_blueprint(auth_bp)
 app.register_blueprint(main_bp)
+app.register_blueprint(uploads_bp)
+app.register_blueprint(metrics_bp)
+app.register_blueprint(assets_bp)
+app.register_blueprint(tiles_bp)
+
+# Comandos de importação/exportação (flask --app app contents ...)
+app.cli.add_command(contents_cli)
+
+# CSS e JavaScript com hash no nome, pré-comprimidos
+init_assets(app)
+
+# Tabelas e colunas em falta, migrações, índices espacial (R*Tree) e de texto (FTS5) e versão dos conteúdos
+from spatial import init_spatial_index
+from search import init_search_index
+from cache import init_content_version
+from migrate import run_migrations
+
+with app.app_context():
+    configure_engine(app.config['SQLITE_PRAGMAS'])
+    init_metrics(app, db.engine)
+    db.create_all()
+    add_missing_columns()
+    run_migrations(db.engine)
+    init_spatial_index()
+    init_search_index()
+    init_content_version()
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 5000))
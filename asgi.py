@@ -0,0 +1,289 @@
+"""Ponto de entrada ASGI (modo assíncrono)
+
+Uso: uvicorn asgi:application --workers 4   (requer pip install uvicorn)
+
+O código da aplicação (blueprints, modelos) continua síncrono e corre num
+conjunto limitado de threads por processo (ASGI_THREADS). O event loop trata
+do que depende da velocidade dos clientes, sem ocupar essas threads:
+- o corpo dos pedidos (uploads) é recebido por inteiro antes de a aplicação
+  ser chamada, em memória ou num ficheiro temporário escrito fora do loop;
+- os ficheiros enviados com send_file/send_from_directory (média, incluindo
+  pedidos Range) são lidos por threads de I/O e enviados pelo loop;
+- os emails já são entregues pela outbox em segundo plano (mailer.py).
+"""
+import asyncio
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.http import parse_content_range_header
+from app import app
+
+
+class AsyncFileWrapper:
+    """wsgi.file_wrapper: marca o ficheiro para ser enviado pelo event loop
+
+    Também é iterável, para o caso de a resposta passar por código que não
+    o reconheça.
+    """
+
+    def __init__(self, file, buffer_size=8192):
+        self.file = file
+        self.buffer_size = buffer_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self.file.read(self.buffer_size)
+        if not chunk:
+            raise StopIteration()
+        return chunk
+
+    # Respostas 206: o werkzeug (ou send_file, aqui) salta para o início do intervalo
+    def seekable(self):
+        return hasattr(self.file, 'seek')
+
+    def seek(self, offset, whence=0):
+        return self.file.seek(offset, whence)
+
+    def tell(self):
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+class RequestTooLarge(Exception):
+    """Corpo do pedido acima de MAX_CONTENT_LENGTH"""
+
+
+class AsgiAdapter:
+    """Adaptador ASGI -> WSGI com um número limitado de threads por processo"""
+
+    def __init__(self, wsgi_app, threads=32, io_threads=8, body_memory=1024 * 1024,
+                 max_body=None, file_chunk_size=256 * 1024):
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(threads, thread_name_prefix='wsgi')
+        self.io_executor = ThreadPoolExecutor(io_threads, thread_name_prefix='asgi-io')
+        self.body_memory = body_memory
+        self.max_body = max_body
+        self.file_chunk_size = file_chunk_size
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.http(scope, receive, send)
+        else:
+            raise RuntimeError(f"Tipo de ligação ASGI não suportado: {scope['type']}")
+
+    async def lifespan(self, receive, send):
+        """Arranque e paragem do servidor"""
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                self.io_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def read_body(self, receive):
+        """Receber o corpo do pedido (em memória até body_memory, depois em disco)"""
+        loop = asyncio.get_running_loop()
+        body = io.BytesIO()
+        size = 0
+        spooled = False
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return None
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if self.max_body is not None and size > self.max_body:
+                body.close()
+                raise RequestTooLarge()
+
+            if not spooled and size > self.body_memory:
+                # Uploads grandes passam para um ficheiro temporário (escritas fora do loop)
+                disk = await loop.run_in_executor(self.io_executor, tempfile.TemporaryFile)
+                await loop.run_in_executor(self.io_executor, disk.write, body.getvalue())
+                body = disk
+                spooled = True
+            if chunk:
+                if spooled:
+                    await loop.run_in_executor(self.io_executor, body.write, chunk)
+                else:
+                    body.write(chunk)
+            if not message.get('more_body', False):
+                break
+
+        body.seek(0)
+        return body, size
+
+    def build_environ(self, scope, body, size):
+        """Ambiente WSGI (PEP 3333) a partir do scope ASGI"""
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(size),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': body,
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': True,
+            'wsgi.run_once': False,
+        }
+
+        # Ficheiros abertos pela aplicação com wsgi.file_wrapper (enviados pelo event loop)
+        files = []
+
+        def file_wrapper(file, buffer_size=8192):
+            wrapper = AsyncFileWrapper(file, buffer_size)
+            files.append(wrapper)
+            return wrapper
+
+        environ['wsgi.file_wrapper'] = file_wrapper
+        environ['asgi.files'] = files
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_TYPE':
+                environ['CONTENT_TYPE'] = value
+            elif name != 'CONTENT_LENGTH':
+                key = f'HTTP_{name}'
+                environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def call_app(self, environ):
+        """Chamar a aplicação (numa thread WSGI): (estado, headers, iterável, primeiro bloco)
+
+        Para ficheiros, é devolvido (iterável, ficheiro, intervalo) sem ser lido
+        (primeiro bloco None).
+        """
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        files = environ['asgi.files']
+        if files and result is files[-1]:
+            return response['status'], response['headers'], (result, files[-1], None), None
+        if files and response['status'] == 206:
+            # Pedido Range: o intervalo vem do cabeçalho Content-Range da resposta
+            content_range = dict((name.lower(), value) for name, value in response['headers']).get('content-range')
+            byte_range = parse_content_range_header(content_range)
+            if byte_range is not None and byte_range.start is not None:
+                return response['status'], response['headers'], (result, files[-1], byte_range), None
+
+        iterator = iter(result)
+        first = next(iterator, b'')  # start_response pode só ser chamado aqui (geradores)
+        return response['status'], response['headers'], (result, iterator), first
+
+    async def send_file(self, result, wrapper, byte_range, send):
+        """Enviar um ficheiro a partir do event loop, lido por threads de I/O"""
+        loop = asyncio.get_running_loop()
+        remaining = None
+        if byte_range is not None:
+            remaining = byte_range.stop - byte_range.start
+            await loop.run_in_executor(self.io_executor, wrapper.seek, byte_range.start)
+
+        try:
+            while remaining is None or remaining > 0:
+                size = self.file_chunk_size if remaining is None else min(self.file_chunk_size, remaining)
+                chunk = await loop.run_in_executor(self.io_executor, wrapper.file.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            await loop.run_in_executor(self.io_executor, result.close)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def send_iterable(self, result, iterator, first, send):
+        """Enviar uma resposta normal (blocos seguintes lidos numa thread WSGI)"""
+        loop = asyncio.get_running_loop()
+        try:
+            chunk = first
+            while chunk is not None:
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    async def http(self, scope, receive, send):
+        """Tratar um pedido HTTP"""
+        try:
+            received = await self.read_body(receive)
+        except RequestTooLarge:
+            await self.send_error(send, 413, b'Request Entity Too Large')
+            return
+        if received is None:
+            return  # o cliente desligou-se antes de enviar o pedido todo
+
+        body, size = received
+        loop = asyncio.get_running_loop()
+        try:
+            environ = self.build_environ(scope, body, size)
+            status, headers, result, first = await loop.run_in_executor(self.executor, self.call_app, environ)
+        except Exception:
+            body.close()
+            app.logger.exception(f"Erro no pedido ASGI {scope['method']} {scope['path']}")
+            await self.send_error(send, 500, b'Internal Server Error')
+            return
+        body.close()
+
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        if first is None:
+            await self.send_file(*result, send)
+        else:
+            await self.send_iterable(*result, first, send)
+
+    async def send_error(self, send, status, message):
+        """Resposta de erro simples (sem passar pela aplicação)"""
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'text/plain'), (b'content-length', str(len(message)).encode())]})
+        await send({'type': 'http.response.body', 'body': message})
+
+
+application = AsgiAdapter(
+    app,
+    threads=app.config['ASGI_THREADS'],
+    io_threads=app.config['ASGI_IO_THREADS'],
+    body_memory=app.config['ASGI_BODY_MEMORY'],
+    max_body=app.config['MAX_CONTENT_LENGTH'],
+    file_chunk_size=app.config['ASGI_FILE_CHUNK_SIZE'],
+)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit("O modo assíncrono requer um servidor ASGI: pip install uvicorn")
+    uvicorn.run('asgi:application', host='0.0.0.0', port=int(os.environ.get('PORT', 5000)),
+                workers=int(os.environ.get('ASGI_WORKERS', 1)))
@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import tempfile
+from flask import Blueprint, current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # brotli é opcional (sem ele só são gerados os .gz)
+    brotli = None
+
+assets_bp = Blueprint('assets', __name__)
+
+MANIFEST_NAME = 'manifest.json'
+
+# Codificações pré-comprimidas, pela ordem de preferência
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprinted_name(filename, data):
+    """Nome com o hash do conteúdo ("css/style.css" -> "css/style.1a2b3c4d5e6f.css")"""
+    digest = hashlib.sha256(data).hexdigest()[:12]
+    base, ext = os.path.splitext(filename)
+    return f'{base}.{digest}{ext}'
+
+
+def _write_atomic(path, data):
+    """Escrever o ficheiro de uma só vez (outros processos nunca veem metade)"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def build_assets(source_folder, output_folder, files):
+    """Copiar os ficheiros com nomes por hash e gerar as versões .gz/.br
+
+    Os ficheiros de versões anteriores não são apagados: páginas já em cache
+    nos browsers continuam a encontrá-los. Devolve o manifesto
+    {nome lógico: nome com hash}.
+    """
+    manifest = {}
+    for filename in files:
+        with open(os.path.join(source_folder, filename), 'rb') as f:
+            data = f.read()
+
+        name = fingerprinted_name(filename, data)
+        manifest[filename] = name
+        path = os.path.join(output_folder, name)
+        if os.path.exists(path):
+            continue  # conteúdo igual ao de uma build anterior
+
+        # Só guardar as versões comprimidas que ficam realmente mais pequenas
+        compressed = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            compressed['.br'] = brotli.compress(data, quality=11)
+        for suffix, payload in compressed.items():
+            if len(payload) < len(data):
+                _write_atomic(path + suffix, payload)
+        # O original por último: a sua existência indica uma build completa
+        _write_atomic(path, data)
+
+    _write_atomic(os.path.join(output_folder, MANIFEST_NAME),
+                  json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(output_folder):
+    """Ler o manifesto de uma build anterior ({} se não existir)"""
+    try:
+        with open(os.path.join(output_folder, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_assets(app):
+    """Gerar os ficheiros estáticos com hash (ou ler o manifesto já gerado)"""
+    config = app.config
+    if config['ASSETS_BUILD']:
+        manifest = build_assets(app.static_folder, config['ASSETS_FOLDER'], config['ASSETS_FILES'])
+    else:
+        manifest = load_manifest(config['ASSETS_FOLDER'])
+    app.extensions['assets'] = manifest
+
+
+@assets_bp.app_template_global('asset_url')
+def asset_url(filename):
+    """URL de um ficheiro estático: versão com hash se existir, senão a normal
+
+    Em modo debug usa sempre o ficheiro original (alterações sem nova build).
+    """
+    manifest = current_app.extensions.get('assets', {})
+    if filename in manifest and not current_app.debug:
+        return url_for('assets.asset', filename=manifest[filename])
+    return url_for('static', filename=filename)
+
+
+@assets_bp.route('/assets/<path:filename>')
+def asset(filename):
+    """Servir um ficheiro com hash (imutável), comprimido conforme o Accept-Encoding"""
+    folder = current_app.config['ASSETS_FOLDER']
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    max_age = current_app.config['ASSETS_MAX_AGE']
+
+    for encoding, suffix in ENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(folder, filename + suffix)):
+            response = send_from_directory(folder, filename + suffix, mimetype=mimetype, max_age=max_age)
+            response.content_encoding = encoding
+            break
+    else:
+        response = send_from_directory(folder, filename, mimetype=mimetype, max_age=max_age)
+
+    # O nome muda com o conteúdo: o browser não precisa de revalidar
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+if __name__ == '__main__':
+    from flask import Flask
+    from config import Config
+
+    # Build para deploy (com ASSETS_BUILD=false, a aplicação só lê o manifesto)
+    app = Flask(__name__)
+    app.config.from_object(Config)
+    manifest = build_assets(app.static_folder, app.config['ASSETS_FOLDER'], app.config['ASSETS_FILES'])
+    for source, name in sorted(manifest.items()):
+        print(f"{source} -> {name}")
+    if brotli is None:
+        print("brotli não está instalado: só foram gerados ficheiros .gz")
@@ -1,7 +1,9 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from flask_login import login_user, logout_user, login_required, current_user
 from models import db, User
-from utils import generate_validation_token, verify_validation_token, send_validation_email
+from utils import generate_validation_token, verify_validation_token
+from mailer import queue_validation_email
+from user_cache import user_cache
 from datetime import datetime, timedelta
 
 auth_bp = Blueprint('auth', __name__)
@@ -45,10 +47,10 @@ def register():
         db.session.add(user)
         db.session.commit()
         
-        # Enviar email
-        email_sent = send_validation_email(email, username, validation_token)
+        # Pôr o email na fila de envio (enviado em segundo plano)
+        email_queued = queue_validation_email(email, username, validation_token)
         
-        if email_sent:
+        if email_queued:
             flash(f'Registo efetuado! Verifica o email {email} para validar a conta.', 'success')
         else:
             flash(f'Registo efetuado! Link de validação: /validate/{validation_token}', 'warning')
@@ -88,6 +90,7 @@ def validate_email(token):
     user.is_validated = True
     user.validation_token = None
     db.session.commit()
+    user_cache.bump()
     
     # Guardar user_id na sessão para definir password
     session['pending_password_user_id'] = user.id
@@ -133,6 +136,7 @@ def set_password():
         # Definir password
         user.set_password(password)
         db.session.commit()
+        user_cache.bump()
         
         # Limpar sessão
         session.pop('pending_password_user_id', None)
@@ -0,0 +1,228 @@
+"""Capacidade com clientes lentos: servidor síncrono vs. modo assíncrono (asgi.py)
+
+Uso: python benchmarks/bench_async.py [--threads 8] [--slow-clients 64] [--rate 512]
+
+Simula, no próprio processo e com o mesmo número de threads para a aplicação:
+- síncrono: cada pedido ocupa uma thread enquanto o cliente envia o upload e
+  recebe a resposta (como workers sync/gthread do gunicorn ou app.run());
+- assíncrono: o AsgiAdapter recebe os uploads e envia os ficheiros pelo event
+  loop, e só usa uma thread enquanto a aplicação corre.
+Os clientes lentos fazem uploads (POST /login com um corpo grande) e
+downloads de um ficheiro de média (--media-kb) a --rate KB/s; ao mesmo tempo
+são medidos pedidos rápidos (/api/contents) de clientes normais. A base de
+dados e o ficheiro são criados numa pasta temporária.
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from werkzeug.test import EnvironBuilder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+CHUNK = 64 * 1024
+FAST_PATH = '/api/contents?limit=20'
+UPLOAD_PATH = '/login'
+
+# Aplicação importada em prepare_app, depois de configurado o ambiente
+app = None
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def prepare_app(args, workdir):
+    """Base de dados sintética e um ficheiro de média numa pasta temporária; devolve o ficheiro"""
+    global app
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['MAIL_SENDER_THREAD'] = 'false'
+    os.environ['GEOCODER_UPSTREAM'] = 'none'
+
+    from app import app as flask_app
+    from models import db, Content, User
+    from media import store_blob
+    from seed import seed_database
+
+    app = flask_app
+    app.config.update(
+        UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+        CHUNKED_UPLOAD_FOLDER=os.path.join(workdir, 'partial_uploads'),
+        MAIL_OUTBOX_FOLDER=os.path.join(workdir, 'outbox'),
+        USER_CACHE_VERSION_FILE=os.path.join(workdir, 'users.version'),
+        TILE_CACHE_FOLDER=os.path.join(workdir, 'tiles'),
+    )
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    with app.app_context():
+        seed_database(db, Content, User, args.places, 10)
+        media = store_blob(io.BytesIO(os.urandom(args.media_kb * 1024)), 'mp4')
+        db.session.commit()
+    return media
+
+
+def upload_body(size):
+    return b'username_or_email=lento&password=' + b'x' * size
+
+
+class SlowInput:
+    """wsgi.input de um cliente lento (cada leitura espera o tempo de transmissão)"""
+
+    def __init__(self, data, rate):
+        self.data = data
+        self.position = 0
+        self.rate = rate
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = len(self.data) - self.position
+        chunk = self.data[self.position:self.position + min(size, CHUNK)]
+        self.position += len(chunk)
+        time.sleep(len(chunk) / self.rate)
+        return chunk
+
+    def readline(self, size=-1):
+        return self.read(size)
+
+
+def sync_request(method, path, body=b'', content_type=None, rate=None):
+    """Um pedido tratado como num servidor síncrono (a thread espera pelo cliente)"""
+    started = time.perf_counter()
+    builder = EnvironBuilder(path=path, method=method, content_type=content_type,
+                             content_length=len(body) if body else None)
+    environ = builder.get_environ()
+    environ['wsgi.input'] = SlowInput(body, rate) if rate else SlowInput(body, float('inf'))
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    result = app(environ, start_response)
+    try:
+        for chunk in result:
+            if rate:
+                time.sleep(len(chunk) / rate)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return time.perf_counter() - started
+
+
+def run_sync(args, media):
+    """Servidor síncrono com --threads threads"""
+    rate = args.rate * 1024
+    body = upload_body(args.upload_kb * 1024)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        slow = []
+        for i in range(args.slow_clients):
+            if i % 2:
+                slow.append(executor.submit(sync_request, 'GET', f'/media/{media}', rate=rate))
+            else:
+                slow.append(executor.submit(sync_request, 'POST', UPLOAD_PATH, body,
+                                            'application/x-www-form-urlencoded', rate))
+        time.sleep(0.05)  # os pedidos rápidos chegam depois dos clientes lentos
+
+        fast = []
+        for _ in range(args.fast_requests):
+            submitted = time.perf_counter()
+            future = executor.submit(sync_request, 'GET', FAST_PATH)
+            fast.append((submitted, future))
+        latencies = []
+        for submitted, future in fast:
+            future.result()
+            latencies.append(time.perf_counter() - submitted)
+        wait(slow)
+    return latencies, time.perf_counter() - started
+
+
+async def asgi_request(adapter, method, path, body=b'', content_type=None, rate=None):
+    """Um pedido pelo AsgiAdapter, com um cliente que envia e recebe a rate bytes/s"""
+    started = time.perf_counter()
+    parts = [body[i:i + CHUNK] for i in range(0, len(body), CHUNK)] or [b'']
+    messages = [{'type': 'http.request', 'body': part, 'more_body': i < len(parts) - 1}
+                for i, part in enumerate(parts)]
+
+    async def receive():
+        if not messages:
+            return {'type': 'http.disconnect'}
+        message = messages.pop(0)
+        if rate:
+            await asyncio.sleep(len(message['body']) / rate)
+        return message
+
+    async def send(message):
+        if rate and message['type'] == 'http.response.body':
+            await asyncio.sleep(len(message.get('body', b'')) / rate)
+
+    path, _, query = path.partition('?')
+    headers = [(b'content-type', content_type.encode())] if content_type else []
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'headers': headers, 'http_version': '1.1', 'scheme': 'http',
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+    await adapter(scope, receive, send)
+    return time.perf_counter() - started
+
+
+async def run_async_mode(args, media):
+    """Modo assíncrono com --threads threads para a aplicação"""
+    from asgi import AsgiAdapter
+    adapter = AsgiAdapter(app, threads=args.threads, max_body=app.config['MAX_CONTENT_LENGTH'])
+    rate = args.rate * 1024
+    body = upload_body(args.upload_kb * 1024)
+    started = time.perf_counter()
+
+    slow = []
+    for i in range(args.slow_clients):
+        if i % 2:
+            slow.append(asyncio.create_task(asgi_request(adapter, 'GET', f'/media/{media}', rate=rate)))
+        else:
+            slow.append(asyncio.create_task(asgi_request(
+                adapter, 'POST', UPLOAD_PATH, body, 'application/x-www-form-urlencoded', rate)))
+    await asyncio.sleep(0.05)
+
+    latencies = await asyncio.gather(*(asgi_request(adapter, 'GET', FAST_PATH)
+                                       for _ in range(args.fast_requests)))
+    await asyncio.gather(*slow)
+    adapter.executor.shutdown()
+    adapter.io_executor.shutdown()
+    return list(latencies), time.perf_counter() - started
+
+
+def report(name, latencies, total, args):
+    total_requests = args.slow_clients + args.fast_requests
+    print(f"{name:12} pedidos rápidos: p50 {percentile(latencies, 0.5) * 1000:8.1f} ms  "
+          f"p95 {percentile(latencies, 0.95) * 1000:8.1f} ms   total {total:6.2f} s  "
+          f"({total_requests / total:6.1f} pedidos/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8, help='threads para a aplicação (nos dois modos)')
+    parser.add_argument('--slow-clients', type=int, default=64, help='clientes lentos (metade uploads, metade downloads)')
+    parser.add_argument('--rate', type=int, default=512, help='velocidade dos clientes lentos (KB/s)')
+    parser.add_argument('--upload-kb', type=int, default=512, help='tamanho de cada upload (KB)')
+    parser.add_argument('--fast-requests', type=int, default=50, help='pedidos rápidos medidos')
+    parser.add_argument('--media-kb', type=int, default=2048, help='tamanho do ficheiro descarregado (KB)')
+    parser.add_argument('--places', type=int, default=1000, help='conteúdos na base de dados sintética')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-async-') as workdir:
+        media = prepare_app(args, workdir)
+        print(f"{args.slow_clients} clientes lentos a {args.rate} KB/s (uploads de {args.upload_kb} KB, "
+              f"downloads de {args.media_kb} KB), {args.threads} threads, "
+              f"{args.fast_requests} pedidos rápidos a {FAST_PATH}")
+
+        latencies, total = run_sync(args, media)
+        report('síncrono', latencies, total, args)
+        latencies, total = asyncio.run(run_async_mode(args, media))
+        report('assíncrono', latencies, total, args)
+
+
+if __name__ == '__main__':
+    main()
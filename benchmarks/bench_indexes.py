@@ -0,0 +1,115 @@
+"""Planos de execução e tempos das consultas frequentes antes e depois da migração de índices
+
+Uso: python benchmarks/bench_indexes.py [-n 50000]
+Cria uma base de dados SQLite temporária sem os índices (como uma base de dados
+antiga), mede as consultas, aplica as migrações e volta a medir.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import db  # noqa: E402
+from migrate import load_migrations, run_migrations  # noqa: E402
+
+CATEGORIES = ['restaurante', 'museu', 'monumento', 'miradouro', 'praia', 'jardim', 'outro']
+
+QUERIES = [
+    ('dashboard', "SELECT id, title FROM contents WHERE user_id = 7 "
+                  "ORDER BY created_at DESC, id DESC LIMIT 24"),
+    ('página inicial', "SELECT id, title FROM contents ORDER BY created_at DESC, id DESC LIMIT 6"),
+    ('categoria', "SELECT id, title FROM contents WHERE category = 'museu' "
+                  "ORDER BY created_at DESC, id DESC LIMIT 100"),
+    ('área do mapa', "SELECT id FROM contents WHERE latitude BETWEEN 38.70 AND 38.71 "
+                     "AND longitude BETWEEN -9.15 AND -9.14"),
+    ('ficheiro partilhado', "SELECT media_variants FROM contents WHERE media_filename = 'f123.jpg'"),
+    ('validar email', "SELECT id FROM users WHERE validation_token = 'token-42'"),
+    ('fila de média', "SELECT id FROM media_jobs WHERE status = 'queued' "
+                      "AND run_after <= '2030-01-01' ORDER BY id LIMIT 5"),
+]
+
+
+def populate(engine, rows):
+    """Preencher a base de dados com utilizadores, conteúdos e tarefas aleatórios"""
+    random.seed(42)
+    start = datetime(2025, 1, 1)
+    users = [{'id': i, 'username': f'user{i}', 'email': f'user{i}@example.com',
+              'validation_token': f'token-{i}'} for i in range(1, 501)]
+    contents = [{
+        'title': f'Local {i}', 'description': 'Descrição', 'category': random.choice(CATEGORIES),
+        'media_type': 'image', 'media_filename': f'f{i}.jpg',
+        'latitude': 38.69 + random.random() * 0.1, 'longitude': -9.23 + random.random() * 0.14,
+        'created_at': start + timedelta(seconds=i * 60), 'user_id': random.randint(1, 500),
+    } for i in range(rows)]
+    jobs = [{
+        'kind': 'image_derivatives', 'content_id': i, 'media_filename': f'f{i}.jpg',
+        'status': 'queued' if i % 100 == 0 else 'done', 'attempts': 0,
+        'run_after': start + timedelta(seconds=i * 60),
+    } for i in range(rows)]
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, username, email, validation_token) "
+                          "VALUES (:id, :username, :email, :validation_token)"), users)
+        conn.execute(text("INSERT INTO contents (title, description, category, media_type, media_filename, "
+                          "latitude, longitude, created_at, user_id) VALUES (:title, :description, :category, "
+                          ":media_type, :media_filename, :latitude, :longitude, :created_at, :user_id)"), contents)
+        conn.execute(text("INSERT INTO media_jobs (kind, content_id, media_filename, status, attempts, run_after) "
+                          "VALUES (:kind, :content_id, :media_filename, :status, :attempts, :run_after)"), jobs)
+        conn.execute(text("ANALYZE"))
+
+
+def measure(engine, repeat):
+    """Plano (SCAN/SEARCH) e tempo médio em ms de cada consulta"""
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES:
+            plan = ' / '.join(row[3] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+            started = time.perf_counter()
+            for _ in range(repeat):
+                conn.execute(text(sql)).all()
+            results[name] = (plan, (time.perf_counter() - started) / repeat * 1000)
+    return results
+
+
+def main():
+    """Executar o benchmark e mostrar os planos antes e depois"""
+    parser = argparse.ArgumentParser(description='Benchmark da migração de índices')
+    parser.add_argument('-n', '--rows', type=int, default=50000, help='número de conteúdos')
+    parser.add_argument('-r', '--repeat', type=int, default=20, help='repetições por consulta')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        engine = create_engine(f"sqlite:///{os.path.join(folder, 'bench.db')}")
+        db.metadata.create_all(engine)
+
+        # Remover os índices criados pelas migrações (esquema anterior)
+        with engine.begin() as conn:
+            for _, module in load_migrations():
+                for name, _, _ in getattr(module, 'INDEXES', []):
+                    conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+
+        populate(engine, args.rows)
+        before = measure(engine, args.repeat)
+        run_migrations(engine)
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+        after = measure(engine, args.repeat)
+        engine.dispose()
+
+    print(f"\n{args.rows} conteúdos, média de {args.repeat} execuções\n")
+    for name, _ in QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        print(f"{name}: {ms_before:.2f} ms -> {ms_after:.2f} ms")
+        print(f"  antes:  {plan_before}")
+        print(f"  depois: {plan_after}")
+
+
+if __name__ == '__main__':
+    main()
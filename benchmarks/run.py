@@ -0,0 +1,362 @@
+"""Benchmark das páginas e APIs principais sobre uma base de dados sintética
+
+Uso:
+    python benchmarks/run.py --places 10000 --users 200 -n 200 -o resultados.json
+    python benchmarks/run.py --mode server -c 4 -o resultados.json
+    python benchmarks/run.py --compare base.json resultados.json
+
+A aplicação corre no próprio processo (cliente de testes do Flask) ou num
+servidor HTTP local (--mode server). Para cada cenário são registados os
+percentis de latência, o débito, o tamanho das respostas e as queries SQL por
+pedido (lidas do cabeçalho Server-Timing). O modo --compare assinala
+regressões entre duas execuções e termina com código 1 se existirem.
+"""
+import argparse
+import http.client
+import io
+import json
+import logging
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from seed import BENCH_PASSWORD, BENCH_USERNAME  # noqa: E402
+
+QUERIES_RE = re.compile(r'db;desc="(\d+) queries"')
+
+# Área visível típica do mapa (centro de Lisboa)
+MAP_BBOX = '-9.20,38.69,-9.10,38.75'
+
+# Tiles vetoriais do centro de Lisboa (zoom 14, bloco de 4x4)
+TILE_ZOOM, TILE_X, TILE_Y = 14, 7774, 6276
+
+
+def percentile(values, fraction):
+    """Percentil (nearest-rank) de uma lista já ordenada"""
+    if not values:
+        return None
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def make_png(index):
+    """PNG pequeno e diferente para cada upload (evita a deduplicação por hash)"""
+    from PIL import Image
+    buffer = io.BytesIO()
+    color = (index % 256, (index // 256) % 256, (index // 65536) % 256)
+    Image.new('RGB', (64, 48), color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def multipart(fields, files):
+    """Corpo multipart/form-data: (bytes, content-type)"""
+    boundary = f'----bench{time.time_ns()}'
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data, mimetype) in files.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                     f'Content-Type: {mimetype}\r\n\r\n'.encode() + data + b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+def form(fields):
+    """Corpo application/x-www-form-urlencoded: (bytes, content-type)"""
+    from urllib.parse import urlencode
+    return urlencode(fields).encode(), 'application/x-www-form-urlencoded'
+
+
+# Cenários: nome -> (sessão, função i -> (método, caminho, corpo, content-type))
+# Sessão: 'anon' (sem login), 'user' (com login) ou 'fresh' (cookies limpos em cada pedido)
+SCENARIOS = {
+    'home': ('anon', lambda i: ('GET', '/', None, None)),
+    'map': ('anon', lambda i: ('GET', '/map', None, None)),
+    'api_contents': ('anon', lambda i: ('GET', '/api/contents', None, None)),
+    'api_clusters': ('anon', lambda i: ('GET', f'/api/contents/clusters?bbox={MAP_BBOX}&z=13', None, None)),
+    'tiles': ('anon', lambda i: ('GET', f'/tiles/contents/{TILE_ZOOM}/{TILE_X + i % 4}/{TILE_Y + i // 4 % 4}.pbf',
+                                 None, None)),
+    'dashboard': ('user', lambda i: ('GET', '/dashboard', None, None)),
+    'login': ('fresh', lambda i: ('POST', '/login', *form({'username_or_email': BENCH_USERNAME,
+                                                            'password': BENCH_PASSWORD}))),
+    'upload': ('user', lambda i: ('POST', '/content/new', *multipart(
+        {'title': f'Upload {i}', 'description': 'Upload de benchmark', 'category': 'outro',
+         'latitude': '38.7223', 'longitude': '-9.1393', 'location_name': 'Baixa, Lisboa'},
+        {'media_file': (f'bench{i}.png', make_png(i), 'image/png')}))),
+}
+
+
+class InProcessClient:
+    """Pedidos pela aplicação WSGI no próprio processo (cliente de testes do Flask)"""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def reset(self):
+        """Esquecer a sessão (cookies)"""
+        self.client = self.app.test_client()
+
+    def request(self, method, path, body=None, content_type=None):
+        response = self.client.open(path, method=method, data=body, content_type=content_type,
+                                    headers={'Accept-Encoding': 'gzip'})
+        return response.status_code, response.get_data(), response.headers
+
+
+class HttpClient:
+    """Pedidos HTTP a um servidor local, com ligação keep-alive e cookies"""
+
+    def __init__(self, host, port):
+        self.connection = http.client.HTTPConnection(host, port, timeout=60)
+        self.cookies = {}
+
+    def reset(self):
+        """Esquecer a sessão (cookies)"""
+        self.cookies = {}
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        if content_type:
+            headers['Content-Type'] = content_type
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{k}={v}' for k, v in self.cookies.items())
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        data = response.read()
+        for header in response.headers.get_all('Set-Cookie') or []:
+            name, _, rest = header.partition('=')
+            self.cookies[name] = rest.split(';', 1)[0]
+        return response.status, data, response.headers
+
+
+def login(client):
+    """Iniciar sessão com o utilizador do benchmark"""
+    status, _, _ = client.request('POST', '/login', *form({'username_or_email': BENCH_USERNAME,
+                                                            'password': BENCH_PASSWORD}))
+    if status != 302:
+        raise RuntimeError(f'Login do benchmark falhou ({status})')
+
+
+def run_scenario(name, make_client, requests, concurrency, warmup):
+    """Executar um cenário e calcular as estatísticas"""
+    session, build = SCENARIOS[name]
+    counter = iter(range(10 ** 9))
+    lock = threading.Lock()
+
+    def next_index():
+        with lock:
+            return next(counter)
+
+    def worker(count):
+        client = make_client()
+        if session == 'user':
+            login(client)
+        samples = []
+        for i in range(warmup + count):
+            method, path, body, content_type = build(next_index())
+            if session == 'fresh':
+                client.reset()
+            started = time.perf_counter()
+            status, data, headers = client.request(method, path, body, content_type)
+            elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            match = QUERIES_RE.search(headers.get('Server-Timing', ''))
+            samples.append((elapsed, len(data), int(match.group(1)) if match else None, status >= 400))
+        return samples
+
+    per_worker = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(worker, per_worker))
+    wall = time.perf_counter() - started
+
+    samples = [sample for result in results for sample in result]
+    latencies = sorted(sample[0] * 1000 for sample in samples)
+    queries = [sample[2] for sample in samples if sample[2] is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for sample in samples if sample[3]),
+        'p50_ms': round(percentile(latencies, 0.50), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'p99_ms': round(percentile(latencies, 0.99), 3),
+        'mean_ms': round(sum(latencies) / len(latencies), 3),
+        # Inclui o aquecimento de cada worker no tempo total (estimativa conservadora)
+        'throughput_rps': round(len(samples) / wall, 2),
+        'avg_bytes': round(sum(sample[1] for sample in samples) / len(samples), 1),
+        'avg_queries': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def git_commit():
+    """Commit atual (para identificar a execução)"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_app(args, workdir):
+    """Configurar o ambiente (antes de importar a aplicação) e preparar a base de dados"""
+    db_path = os.path.abspath(args.db) if args.db else os.path.join(workdir, 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+    os.environ['MAIL_SENDER_THREAD'] = 'false'
+    os.environ['METRICS_SERVER_TIMING'] = 'true'
+    os.environ['METRICS_SLOW_REQUEST'] = '3600'
+    os.environ['GEOCODER_UPSTREAM'] = 'none'
+
+    from app import app, db
+    from models import Content, User
+    from seed import seed_database
+
+    # Ficheiros do benchmark fora das pastas da aplicação
+    app.config.update(
+        UPLOAD_FOLDER=os.path.join(workdir, 'uploads'),
+        CHUNKED_UPLOAD_FOLDER=os.path.join(workdir, 'partial_uploads'),
+        MAIL_OUTBOX_FOLDER=os.path.join(workdir, 'outbox'),
+        USER_CACHE_VERSION_FILE=os.path.join(workdir, 'users.version'),
+        TILE_CACHE_FOLDER=os.path.join(workdir, 'tiles'),
+        MEDIA_PROCESSING_INLINE=False,
+    )
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    started = time.perf_counter()
+    with app.app_context():
+        seed_database(db, Content, User, args.places, args.users, args.seed)
+    print(f"Base de dados pronta ({args.places} conteúdos, {args.users} utilizadores) "
+          f"em {time.perf_counter() - started:.1f} s")
+    return app
+
+
+def start_server(app):
+    """Servidor HTTP local (werkzeug, multi-thread) numa porta livre"""
+    from werkzeug.serving import make_server
+    # Sem o registo de cada pedido na consola
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run(args):
+    """Executar os cenários pedidos e gravar os resultados em JSON"""
+    with tempfile.TemporaryDirectory(prefix='bench-') as workdir:
+        app = prepare_app(args, workdir)
+
+        server = None
+        if args.mode == 'server':
+            server = start_server(app)
+            host, port = server.server_address[:2]
+            make_client = lambda: HttpClient(host, port)  # noqa: E731
+        else:
+            make_client = lambda: InProcessClient(app)  # noqa: E731
+
+        results = {}
+        try:
+            for name in args.scenarios:
+                results[name] = run_scenario(name, make_client, args.requests, args.concurrency, args.warmup)
+                stats = results[name]
+                print(f"{name:14} p50 {stats['p50_ms']:8.2f} ms  p95 {stats['p95_ms']:8.2f} ms  "
+                      f"p99 {stats['p99_ms']:8.2f} ms  {stats['throughput_rps']:8.1f} req/s  "
+                      f"{stats['avg_bytes']:9.0f} B  {stats['avg_queries']} queries  {stats['errors']} erros")
+        finally:
+            if server is not None:
+                server.shutdown()
+
+    report = {
+        'meta': {
+            'date': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'mode': args.mode,
+            'places': args.places,
+            'users': args.users,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'seed': args.seed,
+        },
+        'scenarios': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Resultados gravados em {args.output}")
+    return report
+
+
+def compare(base_path, current_path, threshold):
+    """Comparar duas execuções; devolve a lista de regressões"""
+    with open(base_path, encoding='utf-8') as f:
+        base = json.load(f)
+    with open(current_path, encoding='utf-8') as f:
+        current = json.load(f)
+
+    regressions = []
+    print(f"{'cenário':14} {'p95 base':>10} {'p95 atual':>10} {'req/s base':>11} {'req/s atual':>11} "
+          f"{'queries':>13}")
+    for name, now in current['scenarios'].items():
+        before = base['scenarios'].get(name)
+        if before is None:
+            print(f"{name:14} (sem base)")
+            continue
+
+        problems = []
+        if now['p95_ms'] > before['p95_ms'] * (1 + threshold):
+            problems.append(f"p95 +{(now['p95_ms'] / before['p95_ms'] - 1) * 100:.0f}%")
+        if now['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            problems.append(f"req/s -{(1 - now['throughput_rps'] / before['throughput_rps']) * 100:.0f}%")
+        if (now['avg_queries'] or 0) > (before['avg_queries'] or 0) + 0.5:
+            problems.append('mais queries')
+        if now['errors'] > before['errors']:
+            problems.append('mais erros')
+
+        queries = f"{before['avg_queries']} -> {now['avg_queries']}"
+        flag = f"  REGRESSÃO: {', '.join(problems)}" if problems else ''
+        print(f"{name:14} {before['p95_ms']:10.2f} {now['p95_ms']:10.2f} {before['throughput_rps']:11.1f} "
+              f"{now['throughput_rps']:11.1f} {queries:>13}{flag}")
+        if problems:
+            regressions.append((name, problems))
+
+    if base['meta'].get('places') != current['meta'].get('places') or \
+            base['meta'].get('mode') != current['meta'].get('mode'):
+        print("AVISO: as execuções usam dados ou modos diferentes; a comparação pode não ser válida.")
+    return regressions
+
+
+def main():
+    """Ler os argumentos e executar o benchmark ou a comparação"""
+    parser = argparse.ArgumentParser(description='Benchmark do Discover Lisboa')
+    parser.add_argument('--places', type=int, default=10000, help='conteúdos sintéticos (10k a 1M)')
+    parser.add_argument('--users', type=int, default=200, help='utilizadores sintéticos')
+    parser.add_argument('--seed', type=int, default=42, help='semente dos dados sintéticos')
+    parser.add_argument('--db', help='ficheiro SQLite a reutilizar entre execuções (por omissão, temporário)')
+    parser.add_argument('--mode', choices=('inprocess', 'server'), default='inprocess')
+    parser.add_argument('-n', '--requests', type=int, default=200, help='pedidos medidos por cenário')
+    parser.add_argument('-c', '--concurrency', type=int, default=1, help='clientes em simultâneo')
+    parser.add_argument('--warmup', type=int, default=5, help='pedidos de aquecimento por cliente')
+    parser.add_argument('-s', '--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('-o', '--output', help='ficheiro JSON com os resultados')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'ATUAL'), help='comparar dois ficheiros JSON')
+    parser.add_argument('--threshold', type=float, default=0.15, help='tolerância nas comparações (0.15 = 15%%)')
+    args = parser.parse_args()
+
+    if args.compare:
+        regressions = compare(*args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    run(args)
+
+
+if __name__ == '__main__':
+    main()
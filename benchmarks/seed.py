@@ -0,0 +1,87 @@
+"""Gerar uma base de dados com locais e utilizadores sintéticos de Lisboa
+
+Usado pelo benchmarks/run.py; os dados dependem só da semente (reprodutíveis).
+"""
+import json
+import os
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import insert, func
+from werkzeug.security import generate_password_hash
+from cache import bump_content_version
+from tiles import reset_tiles
+
+BENCH_PASSWORD = 'benchmark'
+BENCH_USERNAME = 'bench'
+
+CATEGORIES = ['restaurante', 'museu', 'monumento', 'miradouro', 'praia', 'jardim', 'outro']
+WORDS = ['Tasca', 'Largo', 'Jardim', 'Miradouro', 'Museu', 'Casa', 'Pátio', 'Beco', 'Café', 'Igreja',
+         'Palácio', 'Mercado', 'Rua', 'Travessa', 'Convento', 'Quiosque']
+
+GAZETTEER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data',
+                         'gazetteer_lisboa.json')
+
+BATCH_SIZE = 5000
+
+
+def seed_database(db, Content, User, places, users, seed=42):
+    """Inserir users utilizadores e places conteúdos (se ainda não existirem)
+
+    Os conteúdos ficam à volta dos locais do gazetteer, com datas espalhadas
+    pelos últimos dois anos. O utilizador BENCH_USERNAME recebe 1% dos
+    conteúdos (dashboard de um utilizador ativo).
+    """
+    existing = db.session.query(func.count(Content.id)).scalar()
+    if existing >= places:
+        return existing
+
+    rng = random.Random(seed)
+    with open(GAZETTEER, encoding='utf-8') as f:
+        anchors = json.load(f)
+
+    # Uma única hash para todos (calcular uma hash por utilizador demoraria minutos)
+    password_hash = generate_password_hash(BENCH_PASSWORD)
+    now = datetime.utcnow()
+
+    if db.session.query(func.count(User.id)).scalar():
+        user_rows = []
+    else:
+        user_rows = [{'username': BENCH_USERNAME, 'email': 'bench@example.com', 'password_hash': password_hash,
+                      'is_validated': True, 'created_at': now}]
+        user_rows += [{'username': f'user{i}', 'email': f'user{i}@example.com', 'password_hash': password_hash,
+                       'is_validated': True, 'created_at': now} for i in range(1, users)]
+    for start in range(0, len(user_rows), BATCH_SIZE):
+        db.session.execute(insert(User), user_rows[start:start + BATCH_SIZE])
+    db.session.commit()
+
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    bench_id = user_ids[0]
+
+    rows = []
+    for i in range(existing, places):
+        anchor = rng.choice(anchors)
+        rows.append({
+            'title': f"{rng.choice(WORDS)} {anchor['name']} {i}",
+            'description': f"Local sintético perto de {anchor['name']} para testes de desempenho.",
+            'category': rng.choice(CATEGORIES),
+            'media_type': 'image',
+            'media_filename': f'bench/{i}.jpg',
+            'latitude': anchor['lat'] + rng.gauss(0, 0.004),
+            'longitude': anchor['lon'] + rng.gauss(0, 0.004),
+            'location_name': f"{anchor['name']}, Lisboa",
+            'processing_status': 'ready',
+            'created_at': now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400)),
+            'updated_at': now,
+            'user_id': bench_id if rng.random() < 0.01 else rng.choice(user_ids),
+        })
+        if len(rows) >= BATCH_SIZE:
+            db.session.execute(insert(Content), rows)
+            db.session.commit()
+            rows = []
+    if rows:
+        db.session.execute(insert(Content), rows)
+
+    # Os inserts diretos não passam pelas rotas: invalidar snapshots, clusters e tiles
+    reset_tiles(bump_content_version())
+    db.session.commit()
+    return places
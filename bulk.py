@@ -0,0 +1,508 @@
+import csv
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, select
+from models import db, Content, User, AppState, MediaBlob, MediaJob
+from media import is_immutable_media, store_blob, upload_path
+from jobs import JOB_KINDS
+from utils import allowed_file, get_media_type, parse_coordinates
+from cache import bump_content_version
+from tiles import reset_tiles
+
+contents_cli = AppGroup('contents', help='Importar e exportar conteúdos em massa.')
+
+FORMATS = ('ndjson', 'csv', 'geojson')
+EXTENSIONS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson', '.csv': 'csv', '.geojson': 'geojson', '.json': 'geojson'}
+
+# Campos de cada registo (media: caminho do ficheiro, relativo à pasta de média)
+FIELDS = ('id', 'title', 'description', 'category', 'media_type', 'media', 'latitude', 'longitude',
+          'location_name', 'created_at', 'username')
+
+# Erros de registos mostrados (os restantes só são contados)
+MAX_ERRORS_SHOWN = 20
+
+
+def detect_format(path, fmt):
+    """Formato indicado ou, por omissão, o da extensão do ficheiro"""
+    if fmt:
+        return fmt
+    fmt = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if fmt is None:
+        raise click.UsageError(f'Formato de {path} desconhecido: indicar --format ({", ".join(FORMATS)})')
+    return fmt
+
+
+def open_stream(path, mode, fmt):
+    """Abrir o ficheiro (ou stdin/stdout com "-")"""
+    if path == '-':
+        return sys.stdin if mode == 'r' else sys.stdout
+    return open(path, mode, encoding='utf-8', newline='' if fmt == 'csv' else None)
+
+
+# Leitura (um registo de cada vez, com memória limitada)
+
+def read_ndjson(stream):
+    """Registos de um ficheiro NDJSON (um objeto JSON por linha)"""
+    for number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f'linha {number}: JSON inválido ({e})')
+
+
+def read_csv(stream):
+    """Registos de um ficheiro CSV com cabeçalho (campos vazios = sem valor)"""
+    for row in csv.DictReader(stream):
+        yield {key: value for key, value in row.items() if key and value != ''}
+
+
+def feature_to_record(feature):
+    """Registo a partir de uma Feature GeoJSON (ponto em geometry)"""
+    if not isinstance(feature, dict):
+        return ValueError('Feature inválida')
+    record = dict(feature.get('properties') or {})
+    geometry = feature.get('geometry') or {}
+    if geometry.get('type') == 'Point':
+        record['longitude'], record['latitude'] = geometry['coordinates'][:2]
+    return record
+
+
+def read_geojson(stream, chunk_size=64 * 1024):
+    """Registos de uma FeatureCollection, lida por blocos (sem carregar o ficheiro todo)"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+
+    # Avançar até ao início da lista "features"
+    while True:
+        start = buffer.find('"features"')
+        bracket = buffer.find('[', start) if start != -1 else -1
+        if bracket != -1:
+            buffer = buffer[bracket + 1:]
+            break
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            raise click.ClickException('GeoJSON sem a lista "features"')
+        buffer += chunk
+
+    while True:
+        buffer = buffer.lstrip(' \t\r\n,')
+        if buffer.startswith(']'):
+            return
+        try:
+            feature, end = decoder.raw_decode(buffer)
+        except ValueError:
+            # Feature incompleta: ler mais um bloco
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                raise click.ClickException('GeoJSON incompleto')
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield feature_to_record(feature)
+
+
+READERS = {'ndjson': read_ndjson, 'csv': read_csv, 'geojson': read_geojson}
+
+
+# Escrita
+
+class NdjsonWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, record):
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def close(self):
+        pass
+
+
+class CsvWriter:
+    def __init__(self, stream):
+        self.writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        self.writer.writeheader()
+
+    def write(self, record):
+        self.writer.writerow(record)
+
+    def close(self):
+        pass
+
+
+class GeojsonWriter:
+    """FeatureCollection escrita Feature a Feature"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.first = True
+        stream.write('{"type": "FeatureCollection", "features": [\n')
+
+    def write(self, record):
+        properties = dict(record)
+        lon, lat = properties.pop('longitude'), properties.pop('latitude')
+        geometry = {'type': 'Point', 'coordinates': [lon, lat]} if lat is not None and lon is not None else None
+        feature = {'type': 'Feature', 'geometry': geometry, 'properties': properties}
+        self.stream.write(('' if self.first else ',\n') + json.dumps(feature, ensure_ascii=False))
+        self.first = False
+
+    def close(self):
+        self.stream.write('\n]}\n')
+
+
+WRITERS = {'ndjson': NdjsonWriter, 'csv': CsvWriter, 'geojson': GeojsonWriter}
+
+
+# Exportação
+
+def export_rows(batch_size):
+    """Conteúdos e autores por ordem de id, em lotes (paginação por id)"""
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(
+                Content.id, Content.title, Content.description, Content.category, Content.media_type,
+                Content.media_filename, Content.latitude, Content.longitude, Content.location_name,
+                Content.created_at, User.username
+            ).join(User, User.id == Content.user_id)
+            .where(Content.id > last_id)
+            .order_by(Content.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return
+        yield from rows
+        last_id = rows[-1].id
+
+
+def copy_media(filename, media_dir):
+    """Copiar um ficheiro carregado para a pasta de exportação (se ainda lá não estiver)"""
+    target = os.path.join(media_dir, filename)
+    if os.path.exists(target):
+        return True
+    source = upload_path(filename)
+    if not os.path.exists(source):
+        return False
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    shutil.copyfile(source, target)
+    return True
+
+
+@contents_cli.command('export')
+@click.argument('output', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Por omissão, o da extensão do ficheiro.')
+@click.option('--media-dir', type=click.Path(file_okay=False), help='Copiar também os ficheiros de média.')
+@click.option('--batch-size', default=5000, show_default=True, help='Conteúdos lidos por query.')
+def export_command(output, fmt, media_dir, batch_size):
+    """Exportar todos os conteúdos para OUTPUT (NDJSON, CSV ou GeoJSON)."""
+    fmt = detect_format(output, fmt)
+    started = time.perf_counter()
+    count = missing = 0
+
+    stream = open_stream(output, 'w', fmt)
+    try:
+        writer = WRITERS[fmt](stream)
+        for row in export_rows(batch_size):
+            if media_dir and row.media_filename and not copy_media(row.media_filename, media_dir):
+                missing += 1
+            writer.write({
+                'id': row.id,
+                'title': row.title,
+                'description': row.description,
+                'category': row.category,
+                'media_type': row.media_type,
+                'media': row.media_filename,
+                'latitude': row.latitude,
+                'longitude': row.longitude,
+                'location_name': row.location_name,
+                'created_at': row.created_at.isoformat() if row.created_at else None,
+                'username': row.username,
+            })
+            count += 1
+        writer.close()
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+
+    print(f"{count} conteúdos exportados em {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    if missing:
+        print(f"AVISO: {missing} ficheiros de média não encontrados em {current_app.config['UPLOAD_FOLDER']}",
+              file=sys.stderr)
+
+
+# Importação
+
+def parse_record(record, now):
+    """Converter um registo numa linha de contents (sem autor nem ficheiro)"""
+    if isinstance(record, Exception):
+        raise record
+
+    title = str(record.get('title') or '').strip()
+    description = str(record.get('description') or '').strip()
+    category = str(record.get('category') or '').strip()
+    if not title or not description or not category:
+        raise ValueError('título, descrição e categoria são obrigatórios')
+
+    # Tal como no formulário, todo o conteúdo tem um ficheiro multimédia
+    media = record.get('media') or None
+    if not media:
+        raise ValueError('ficheiro multimédia obrigatório')
+    if not allowed_file(media):
+        raise ValueError(f'tipo de ficheiro não permitido: {media}')
+    # O tipo vem sempre da extensão do ficheiro (define a tarefa de processamento)
+    media_type = get_media_type(media)
+    if media_type not in JOB_KINDS:
+        raise ValueError(f'tipo de média inválido: {media_type!r}')
+
+    coordinates = parse_coordinates(record.get('latitude'), record.get('longitude'))
+    if coordinates is None:
+        raise ValueError(f"coordenadas inválidas: {record.get('latitude')!r}, {record.get('longitude')!r}")
+
+    created_at = record.get('created_at')
+    try:
+        created_at = datetime.fromisoformat(created_at) if created_at else now
+    except (TypeError, ValueError):
+        raise ValueError(f'created_at inválida: {created_at!r}')
+
+    return {
+        'title': title[:200],
+        'description': description,
+        'category': category[:50],
+        'media_type': media_type,
+        'media_filename': media,
+        'latitude': coordinates[0],
+        'longitude': coordinates[1],
+        'location_name': (str(record.get('location_name') or '').strip() or None),
+        'processing_status': 'ready',
+        'created_at': created_at,
+        'updated_at': now,
+    }, record.get('username')
+
+
+def import_media(app, path):
+    """Guardar um ficheiro de média no armazenamento por conteúdo (numa thread)"""
+    ext = path.rsplit('.', 1)[-1].lower()
+    with app.app_context(), open(path, 'rb') as f:
+        # As referências são contadas no lote (Importer.insert_rows)
+        return store_blob(f, ext, acquire=False)
+
+
+def progress_key(path):
+    """Chave em app_state com o progresso da importação deste ficheiro"""
+    size = os.path.getsize(path) if path != '-' else 0
+    return 'import:' + hashlib.sha1(f'{os.path.abspath(path)}:{size}'.encode()).hexdigest()
+
+
+class Importer:
+    """Importação por lotes: cada lote é uma transação que também guarda o progresso"""
+
+    def __init__(self, app, media_dir, default_user_id, workers, key):
+        self.app = app
+        self.media_dir = media_dir
+        self.default_user_id = default_user_id
+        self.executor = ThreadPoolExecutor(workers)
+        self.key = key
+        self.users = {}  # username -> id
+        self.imported = 0
+        self.errors = 0
+        self.jobs = 0
+
+    def error(self, position, message):
+        self.errors += 1
+        if self.errors <= MAX_ERRORS_SHOWN:
+            print(f"Registo {position} ignorado: {message}", file=sys.stderr)
+
+    def user_id(self, username):
+        """Autor do conteúdo: utilizador do registo ou o indicado em --user"""
+        if not username:
+            return self.default_user_id
+        if username not in self.users:
+            self.users[username] = db.session.query(User.id).filter_by(username=username).scalar()
+        return self.users[username] or self.default_user_id
+
+    def insert_batch(self, batch, position):
+        """Inserir um lote e guardar o progresso (até ao registo position) na mesma transação"""
+        now = datetime.utcnow()
+        rows = []
+        for record_position, record in batch:
+            try:
+                row, username = parse_record(record, now)
+                row['user_id'] = self.user_id(username)
+                if row['user_id'] is None:
+                    raise ValueError(f'utilizador {username!r} não existe (indicar --user)')
+            except ValueError as e:
+                self.error(record_position, e)
+                continue
+            rows.append((record_position, row))
+
+        failed = set()
+        sources = {}  # ficheiro guardado -> original em --media-dir
+        if self.media_dir:
+            # Ficheiros de média copiados e com hash calculado em paralelo
+            with_media = []
+            for record_position, row in rows:
+                name = row['media_filename']
+                if not name:
+                    continue
+                # Só ficheiros dentro da pasta de média
+                if os.path.isabs(name) or os.path.normpath(name).startswith('..'):
+                    self.error(record_position, f'caminho de média inválido: {name}')
+                    failed.add(record_position)
+                    continue
+                with_media.append((record_position, row))
+            futures = [self.executor.submit(import_media, self.app, os.path.join(self.media_dir, row['media_filename']))
+                       for _, row in with_media]
+            for (record_position, row), future in zip(with_media, futures):
+                try:
+                    source = os.path.join(self.media_dir, row['media_filename'])
+                    row['media_filename'] = future.result()
+                    sources[row['media_filename']] = source
+                except OSError as e:
+                    self.error(record_position, f'ficheiro de média: {e}')
+                    failed.add(record_position)
+        else:
+            # Sem --media-dir só se aceitam ficheiros já guardados nesta instância
+            for record_position, row in rows:
+                name = row['media_filename']
+                if name and not (is_immutable_media(name) and not name.startswith('derivatives/')
+                                 and os.path.isfile(upload_path(name))):
+                    self.error(record_position, f'ficheiro de média não encontrado: {name} (indicar --media-dir)')
+                    failed.add(record_position)
+
+        rows = [row for record_position, row in rows if record_position not in failed]
+        for row in rows:
+            if row['media_filename']:
+                row['processing_status'] = 'pending'
+        if rows:
+            self.insert_rows(rows, sources)
+
+        state = db.session.get(AppState, self.key)
+        if state is None:
+            db.session.add(AppState(key=self.key, value=position, updated_at=now))
+        else:
+            state.value = position
+            state.updated_at = now
+        # Lotes grandes tocam em quase todos os tiles: invalidá-los todos
+        reset_tiles(bump_content_version())
+        db.session.commit()
+        self.imported += len(rows)
+
+    def insert_rows(self, rows, sources):
+        """INSERT em lote (executemany), com as tarefas de média e as referências aos ficheiros"""
+        with_media = [row for row in rows if row['media_filename']]
+        if not with_media:
+            db.session.execute(insert(Content), rows)
+            return
+
+        ids = db.session.execute(
+            insert(Content).returning(Content.id, sort_by_parameter_order=True), rows
+        ).scalars().all()
+        jobs = [{'kind': JOB_KINDS[row['media_type']], 'content_id': content_id,
+                 'media_filename': row['media_filename'], 'status': 'queued', 'attempts': 0,
+                 'run_after': row['updated_at'], 'created_at': row['updated_at']}
+                for content_id, row in zip(ids, rows) if row['media_filename']]
+        db.session.execute(insert(MediaJob), jobs)
+        self.jobs += len(jobs)
+
+        # Uma atualização da contagem de referências por ficheiro distinto
+        references = {}
+        for row in with_media:
+            references[row['media_filename']] = references.get(row['media_filename'], 0) + 1
+        for filename, count in references.items():
+            updated = MediaBlob.query.filter_by(filename=filename).update(
+                {MediaBlob.refcount: MediaBlob.refcount + count}, synchronize_session=False)
+            # Com a referência registada, um ficheiro removido entretanto (último conteúdo
+            # apagado em simultâneo) já não volta a ser apagado: copiá-lo de novo
+            if not os.path.isfile(upload_path(filename)):
+                if filename not in sources:
+                    raise click.ClickException(f'O ficheiro {filename} foi removido durante a importação')
+                with open(sources[filename], 'rb') as f:
+                    store_blob(f, filename.rsplit('.', 1)[-1], acquire=False)
+            if not updated:
+                db.session.add(MediaBlob(filename=filename, size=os.path.getsize(upload_path(filename)),
+                                         refcount=count))
+
+    def close(self):
+        self.executor.shutdown()
+
+
+@contents_cli.command('import')
+@click.argument('source', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Por omissão, o da extensão do ficheiro.')
+@click.option('--media-dir', type=click.Path(exists=True, file_okay=False),
+              help='Pasta com os ficheiros indicados no campo "media" (sem ela, só ficheiros já guardados '
+                   'nesta instância).')
+@click.option('--user', 'username', help='Autor dos registos sem "username" (ou com um utilizador inexistente).')
+@click.option('--batch-size', default=5000, show_default=True, help='Registos por transação.')
+@click.option('--workers', default=4, show_default=True, help='Threads para copiar os ficheiros de média.')
+@click.option('--restart', is_flag=True, help='Ignorar o progresso de uma importação interrompida.')
+def import_command(source, fmt, media_dir, username, batch_size, workers, restart):
+    """Importar conteúdos de SOURCE (NDJSON, CSV ou GeoJSON).
+
+    Uma importação interrompida continua, na execução seguinte, a partir do
+    último lote confirmado.
+    """
+    fmt = detect_format(source, fmt)
+
+    default_user_id = None
+    if username:
+        default_user_id = db.session.query(User.id).filter_by(username=username).scalar()
+        if default_user_id is None:
+            raise click.UsageError(f'O utilizador {username} não existe')
+
+    key = progress_key(source)
+    state = db.session.get(AppState, key)
+    skip = 0
+    if state is not None and source != '-':
+        if restart:
+            db.session.delete(state)
+            db.session.commit()
+        else:
+            skip = state.value
+            print(f"A continuar a importação a partir do registo {skip + 1}", file=sys.stderr)
+
+    importer = Importer(current_app._get_current_object(), media_dir, default_user_id, workers, key)
+    started = time.perf_counter()
+    position = 0
+    batch = []
+    stream = open_stream(source, 'r', fmt)
+    try:
+        for record in READERS[fmt](stream):
+            position += 1
+            if position <= skip:
+                continue
+            batch.append((position, record))
+            if len(batch) >= batch_size:
+                importer.insert_batch(batch, position)
+                batch = []
+                elapsed = time.perf_counter() - started
+                print(f"{importer.imported} conteúdos importados ({importer.imported / elapsed * 60:.0f}/min)",
+                      file=sys.stderr)
+        if batch:
+            importer.insert_batch(batch, position)
+    finally:
+        importer.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    # Concluída: o progresso deixa de ser necessário
+    AppState.query.filter_by(key=key).delete()
+    db.session.commit()
+
+    elapsed = time.perf_counter() - started
+    print(f"{importer.imported} conteúdos importados em {elapsed:.1f} s "
+          f"({importer.imported / max(elapsed, 1e-9) * 60:.0f}/min), {importer.errors} registos ignorados",
+          file=sys.stderr)
+    if importer.jobs:
+        print(f"{importer.jobs} ficheiros de média na fila de processamento (python worker.py)", file=sys.stderr)
@@ -0,0 +1,136 @@
+import gzip
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from flask import Response, request
+from models import db, AppState
+
+CONTENT_VERSION_KEY = 'content_version'
+
+
+def init_content_version():
+    """Garantir que existe o contador de versão dos conteúdos"""
+    if db.session.get(AppState, CONTENT_VERSION_KEY) is None:
+        db.session.add(AppState(key=CONTENT_VERSION_KEY, value=0))
+        db.session.commit()
+
+
+def get_content_version():
+    """Obter a versão atual dos conteúdos e a data da última alteração"""
+    state = db.session.get(AppState, CONTENT_VERSION_KEY)
+    if state is None:
+        return 0, None
+    return state.value, state.updated_at
+
+
+def bump_content_version():
+    """Incrementar a versão dos conteúdos (chamar antes do commit de cada escrita)"""
+    AppState.query.filter_by(key=CONTENT_VERSION_KEY).update({
+        AppState.value: AppState.value + 1,
+        AppState.updated_at: datetime.utcnow()
+    }, synchronize_session=False)
+    return db.session.query(AppState.value).filter_by(key=CONTENT_VERSION_KEY).scalar() or 0
+
+
+class Snapshot:
+    """Corpo de resposta pré-calculado (e pré-comprimido) para uma versão"""
+
+    def __init__(self, version, last_modified, body, mimetype):
+        self.version = version
+        self.last_modified = last_modified
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=6)
+        self.mimetype = mimetype
+        self.etag = f'{version}-{hashlib.sha1(body).hexdigest()[:16]}'
+
+
+class SnapshotCache:
+    """Snapshots por nome, reconstruídos só quando a versão dos conteúdos muda"""
+
+    def __init__(self):
+        self.snapshots = {}
+        self.lock = threading.Lock()
+
+    def get(self, name, builder, mimetype='application/json'):
+        """Obter o snapshot atual (builder() devolve o corpo em bytes)"""
+        version, last_modified = get_content_version()
+
+        snapshot = self.snapshots.get(name)
+        if snapshot is not None and snapshot.version == version:
+            return snapshot
+
+        with self.lock:
+            snapshot = self.snapshots.get(name)
+            if snapshot is None or snapshot.version != version:
+                snapshot = Snapshot(version, last_modified, builder(), mimetype)
+                self.snapshots[name] = snapshot
+        return snapshot
+
+    def clear(self):
+        """Descartar todos os snapshots"""
+        with self.lock:
+            self.snapshots.clear()
+
+
+snapshot_cache = SnapshotCache()
+
+
+def snapshot_response(snapshot):
+    """Resposta com ETag/Last-Modified (304 se o cliente já tiver esta versão)"""
+    use_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+
+    if use_gzip:
+        response = Response(snapshot.gzipped, mimetype=snapshot.mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+        response.set_etag(snapshot.etag + '-gz')
+    else:
+        response = Response(snapshot.body, mimetype=snapshot.mimetype)
+        response.set_etag(snapshot.etag)
+
+    response.vary.add('Accept-Encoding')
+    response.cache_control.no_cache = True
+    if snapshot.last_modified:
+        response.last_modified = snapshot.last_modified
+
+    return response.make_conditional(request)
+
+
+class TTLCache:
+    """Cache LRU com expiração (por processo)"""
+
+    def __init__(self, maxsize=1024, ttl=86400):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Obter um valor (None se não existir ou tiver expirado)"""
+        with self.lock:
+            item = self.items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.monotonic():
+                del self.items[key]
+                return None
+            self.items.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Guardar um valor (expira ao fim de ttl segundos; por omissão self.ttl)
+
+        Se a cache estiver cheia, descarta o menos usado.
+        """
+        with self.lock:
+            self.items[key] = (time.monotonic() + (ttl if ttl is not None else self.ttl), value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.maxsize:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        """Descartar todos os valores"""
+        with self.lock:
+            self.items.clear()
@@ -0,0 +1,243 @@
+import json
+import re
+import threading
+import time
+import unicodedata
+import urllib.parse
+import urllib.request
+from flask import current_app
+from sqlalchemy import func
+from models import db, Content
+from cache import get_content_version, TTLCache
+
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+# Semelhança mínima (trigramas) para aceitar um resultado aproximado
+TRIGRAM_THRESHOLD = 0.3
+
+
+def normalize(text):
+    """Minúsculas, sem acentos nem pontuação ("Belém," -> "belem")"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+def trigrams(text):
+    """Trigramas de cada palavra, com espaços nas pontas (como o pg_trgm)"""
+    grams = set()
+    for word in text.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def prefix_match(query_words, name_words):
+    """Todas as palavras da pesquisa são início de alguma palavra do nome"""
+    return all(any(word.startswith(q) for word in name_words) for q in query_words)
+
+
+class NominatimUpstream:
+    """Geocoder externo: API de pesquisa do Nominatim (OpenStreetMap)"""
+
+    def __init__(self, url, user_agent, timeout=5):
+        self.url = url
+        self.user_agent = user_agent
+        self.timeout = timeout
+
+    def search(self, query, limit):
+        """Pesquisar um local; devolve [{display_name, lat, lon}]"""
+        # Adicionar "Lisboa" para resultados mais relevantes
+        if 'lisboa' not in normalize(query):
+            query = f'{query}, Lisboa, Portugal'
+        params = urllib.parse.urlencode({'format': 'json', 'q': query, 'limit': limit})
+        request = urllib.request.Request(f'{self.url}?{params}', headers={'User-Agent': self.user_agent})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            results = json.load(response)
+        return [{
+            'display_name': result['display_name'],
+            'lat': float(result['lat']),
+            'lon': float(result['lon'])
+        } for result in results]
+
+
+class FixtureUpstream:
+    """Geocoder externo simulado a partir de um ficheiro JSON (sem rede)
+
+    O ficheiro associa pesquisas normalizadas a listas de resultados.
+    """
+
+    def __init__(self, path):
+        with open(path, encoding='utf-8') as f:
+            self.results = {normalize(key): value for key, value in json.load(f).items()}
+
+    def search(self, query, limit):
+        """Pesquisar um local no ficheiro de fixtures"""
+        return self.results.get(normalize(query), [])[:limit]
+
+
+def make_upstream(config):
+    """Criar o geocoder externo indicado em GEOCODER_UPSTREAM (ou None)"""
+    kind = config['GEOCODER_UPSTREAM']
+    if kind == 'nominatim':
+        return NominatimUpstream(config['NOMINATIM_URL'], config['GEOCODER_USER_AGENT'],
+                                 config['GEOCODER_TIMEOUT'])
+    if kind == 'fixture':
+        return FixtureUpstream(config['GEOCODER_FIXTURE'])
+    return None
+
+
+class Geocoder:
+    """Pesquisa de locais: gazetteer local primeiro, geocoder externo em cache depois"""
+
+    def __init__(self):
+        self.gazetteer = None  # carregado no primeiro pedido
+        self.upstream = None
+        self.cache = None
+        self.entries = []
+        self.index = {}  # trigrama -> posições em entries
+        self.version = None  # versão dos conteúdos refletida no índice
+        self.lock = threading.Lock()
+        self.upstream_interval = 0
+        self.upstream_next = 0.0  # hora a partir da qual o próximo pedido externo pode sair
+        self.upstream_lock = threading.Lock()
+
+    def configure(self, config):
+        """Carregar o gazetteer e criar o geocoder externo e a cache"""
+        with open(config['GEOCODER_GAZETTEER'], encoding='utf-8') as f:
+            self.gazetteer = [
+                {'display_name': place['name'], 'lat': place['lat'], 'lon': place['lon']}
+                for place in json.load(f)
+            ]
+        self.upstream = make_upstream(config)
+        self.cache = TTLCache(config['GEOCODER_CACHE_SIZE'], config['GEOCODER_CACHE_TTL'])
+        self.upstream_interval = config['GEOCODER_UPSTREAM_INTERVAL']
+        self.version = None
+
+    def _content_places(self):
+        """Nomes de local já usados nos conteúdos (com a média das coordenadas)"""
+        rows = db.session.query(
+            Content.location_name,
+            func.avg(Content.latitude),
+            func.avg(Content.longitude)
+        ).filter(
+            Content.location_name.isnot(None),
+            Content.location_name != '',
+            Content.latitude.isnot(None),
+            Content.longitude.isnot(None)
+        ).group_by(Content.location_name).all()
+        return [{'display_name': name, 'lat': lat, 'lon': lon} for name, lat, lon in rows]
+
+    def build(self, version):
+        """Construir o índice de trigramas (gazetteer + locais dos conteúdos)"""
+        entries = []
+        index = {}
+        seen = set()
+        for place in self.gazetteer + self._content_places():
+            key = normalize(place['display_name'])
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            position = len(entries)
+            grams = trigrams(key)
+            entries.append((key, key.split(), grams, place))
+            for gram in grams:
+                index.setdefault(gram, []).append(position)
+
+        with self.lock:
+            self.entries = entries
+            self.index = index
+            self.version = version
+
+    def search_local(self, query, limit):
+        """Pesquisar no índice local por prefixo ou semelhança de trigramas"""
+        version, _ = get_content_version()
+        if self.version != version:
+            self.build(version)
+
+        key = normalize(query)
+        words = key.split()
+        query_grams = trigrams(key)
+
+        with self.lock:
+            entries = self.entries
+            candidates = set()
+            for gram in query_grams:
+                candidates.update(self.index.get(gram, ()))
+
+        scored = []
+        for position in candidates:
+            name, name_words, grams, place = entries[position]
+            if name.startswith(key):
+                score = 3.0
+            elif prefix_match(words, name_words):
+                score = 2.0
+            else:
+                score = len(query_grams & grams) / len(query_grams | grams)
+                if score < TRIGRAM_THRESHOLD:
+                    continue
+            scored.append((-score, len(name), position))
+
+        scored.sort()
+        return [entries[position][3] for _, _, position in scored[:limit]]
+
+    def search_upstream(self, query, limit):
+        """Pesquisar no geocoder externo, guardando os resultados em cache"""
+        if self.upstream is None:
+            return []
+
+        cache_key = (normalize(query), limit)
+        results = self.cache.get(cache_key)
+        if results is not None:
+            return results
+
+        if not self.reserve_upstream():
+            print(f"Geocoder externo limitado: pesquisa por {query!r} ignorada")
+            return []
+
+        try:
+            results = self.upstream.search(query, limit)
+        except (OSError, ValueError, KeyError) as e:
+            # Erros não ficam em cache: a próxima pesquisa tenta de novo
+            print(f"Erro no geocoder externo: {e}")
+            return []
+
+        # Também sem resultados: a mesma pesquisa não volta ao geocoder externo
+        self.cache.set(cache_key, results)
+        return results
+
+    def reserve_upstream(self):
+        """Limite de pedidos externos do processo (um por GEOCODER_UPSTREAM_INTERVAL segundos)
+
+        Espera pela vez se houver no máximo um pedido à frente; caso contrário
+        devolve False (o pedido não é feito).
+        """
+        with self.upstream_lock:
+            now = time.monotonic()
+            wait = self.upstream_next - now
+            if wait > self.upstream_interval:
+                return False
+            self.upstream_next = max(now, self.upstream_next) + self.upstream_interval
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+    def search(self, query, limit=5, upstream=True):
+        """Pesquisar um local; devolve [{display_name, lat, lon, source}]
+
+        Com upstream=False (sugestões enquanto se escreve) só é usado o índice
+        local: a política do Nominatim não permite autocomplete.
+        """
+        if self.gazetteer is None:
+            self.configure(current_app.config)
+
+        results = self.search_local(query, limit)
+        source = 'local'
+        if not results and upstream:
+            results = self.search_upstream(query, limit)
+            source = 'upstream'
+
+        return [dict(result, source=source) for result in results]
+
+
+geocoder = Geocoder()
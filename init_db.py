@@ -1,12 +1,22 @@
 from app import app, db
+from models import add_missing_columns
+from spatial import init_spatial_index
+from search import init_search_index
+from cache import init_content_version
+from migrate import run_migrations
 
 def init_database():
     """Inicializar a base de dados"""
     with app.app_context():
         # Criar todas as tabelas
         db.create_all()
+        add_missing_columns()
+        run_migrations(db.engine)
+        init_spatial_index()
+        init_search_index()
+        init_content_version()
         print("Base de dados inicializada com sucesso!")
-        print("Tabelas criadas: users, contents")
+        print("Tabelas criadas: users, contents, app_state")
 
 if __name__ == '__main__':
     init_database()
@@ -0,0 +1,215 @@
+import json
+import os
+import shutil
+import subprocess
+import wave
+from datetime import datetime, timedelta
+from flask import current_app
+from models import db, Content, MediaJob
+from media import generate_image_derivatives, upload_path
+from cache import bump_content_version
+
+# Tarefa a executar consoante o tipo de média
+JOB_KINDS = {
+    'image': 'image_derivatives',
+    'video': 'video_poster',
+    'audio': 'audio_duration',
+}
+
+
+def enqueue_media_job(content):
+    """Pôr na fila o processamento do ficheiro de um conteúdo (antes do commit)"""
+    kind = JOB_KINDS.get(content.media_type)
+    if not kind or not content.media_filename:
+        content.processing_status = 'ready'
+        return None
+
+    if content.id is None:
+        db.session.flush()
+
+    content.processing_status = 'pending'
+    job = MediaJob(kind=kind, content_id=content.id, media_filename=content.media_filename)
+    db.session.add(job)
+    return job
+
+
+def process_image_derivatives(content):
+    """Gerar miniaturas e WebP (ver media.generate_image_derivatives)"""
+    # O mesmo ficheiro pode já ter derivados gerados para outro conteúdo
+    existing = db.session.query(Content.media_variants).filter(
+        Content.media_filename == content.media_filename,
+        Content.id != content.id,
+        Content.media_variants.isnot(None)
+    ).first()
+    if existing:
+        content.media_variants = existing[0]
+        return
+
+    content.media_variants = generate_image_derivatives(content.media_filename)
+
+
+def process_video_poster(content):
+    """Extrair um frame do vídeo para usar como poster (requer ffmpeg)"""
+    if not shutil.which('ffmpeg'):
+        print("AVISO: ffmpeg não encontrado. Poster do vídeo não gerado.")
+        return
+
+    folder = current_app.config['IMAGE_DERIVATIVES_FOLDER']
+    os.makedirs(upload_path(folder), exist_ok=True)
+    poster = f"{folder}/{content.media_filename.rsplit('.', 1)[0]}_poster.jpg"
+
+    subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-ss', '1', '-i', upload_path(content.media_filename),
+         '-frames:v', '1', '-vf', 'scale=640:-2', upload_path(poster)],
+        check=True, timeout=120
+    )
+    content.media_poster = poster
+    content.media_duration = probe_duration(upload_path(content.media_filename))
+
+
+def process_audio_duration(content):
+    """Calcular a duração de um ficheiro de áudio"""
+    content.media_duration = probe_duration(upload_path(content.media_filename))
+
+
+def probe_duration(path):
+    """Duração em segundos (wave para WAV, ffprobe para os restantes formatos)"""
+    if path.lower().endswith('.wav'):
+        with wave.open(path) as audio:
+            return audio.getnframes() / float(audio.getframerate())
+
+    if not shutil.which('ffprobe'):
+        return None
+
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'json', path],
+        capture_output=True, text=True, check=True, timeout=60
+    )
+    duration = json.loads(result.stdout).get('format', {}).get('duration')
+    return float(duration) if duration else None
+
+
+JOB_HANDLERS = {
+    'image_derivatives': process_image_derivatives,
+    'video_poster': process_video_poster,
+    'audio_duration': process_audio_duration,
+}
+
+
+def claim_job(worker_id):
+    """Reservar a próxima tarefa pronta a executar (None se a fila estiver vazia)"""
+    now = datetime.utcnow()
+    candidates = db.session.query(MediaJob.id).filter(
+        MediaJob.status == 'queued',
+        MediaJob.run_after <= now
+    ).order_by(MediaJob.id).limit(5).all()
+
+    for (job_id,) in candidates:
+        # UPDATE condicional: só um worker consegue mudar o estado de 'queued'
+        claimed = MediaJob.query.filter_by(id=job_id, status='queued').update({
+            MediaJob.status: 'running',
+            MediaJob.locked_by: worker_id,
+            MediaJob.locked_at: now,
+            MediaJob.attempts: MediaJob.attempts + 1
+        }, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return db.session.get(MediaJob, job_id)
+    return None
+
+
+def run_job(job):
+    """Executar uma tarefa reservada, com nova tentativa em caso de erro"""
+    config = current_app.config
+    content = db.session.get(Content, job.content_id)
+
+    # Conteúdo eliminado ou com outro ficheiro entretanto: nada a fazer
+    if content is None or content.media_filename != job.media_filename:
+        job.status = 'done'
+        db.session.commit()
+        return
+
+    try:
+        JOB_HANDLERS[job.kind](content)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(MediaJob, job.id)
+        job.last_error = str(e)
+        job.locked_by = None
+        if job.attempts >= config['JOB_MAX_ATTEMPTS']:
+            job.status = 'failed'
+            content = db.session.get(Content, job.content_id)
+            if content is not None:
+                content.processing_status = 'failed'
+        else:
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(
+                seconds=config['JOB_RETRY_DELAY'] * 2 ** (job.attempts - 1))
+        db.session.commit()
+        print(f"Erro na tarefa {job.id} ({job.kind}): {e}")
+        return
+
+    content.processing_status = 'ready'
+    job.status = 'done'
+    job.last_error = None
+    bump_content_version()
+    db.session.commit()
+
+
+def fail_exhausted_jobs(jobs, error):
+    """Marcar como falhadas as tarefas (da query jobs) que já esgotaram as tentativas"""
+    exhausted = jobs.filter(MediaJob.attempts >= current_app.config['JOB_MAX_ATTEMPTS'])
+    content_ids = [content_id for (content_id,) in exhausted.with_entities(MediaJob.content_id)]
+    if content_ids:
+        Content.query.filter(Content.id.in_(content_ids)).update(
+            {Content.processing_status: 'failed'}, synchronize_session=False)
+    return exhausted.update({
+        MediaJob.status: 'failed',
+        MediaJob.last_error: error,
+        MediaJob.locked_by: None
+    }, synchronize_session=False)
+
+
+def recover_stale_jobs():
+    """Devolver à fila tarefas de workers que terminaram a meio (crash)"""
+    timeout = current_app.config['JOB_LOCK_TIMEOUT']
+    limit = datetime.utcnow() - timedelta(seconds=timeout)
+    stale = MediaJob.query.filter(
+        MediaJob.status == 'running',
+        MediaJob.locked_at < limit
+    )
+
+    # Tarefas que já esgotaram as tentativas (ex.: derrubam o worker) falham
+    fail_exhausted_jobs(stale, 'Worker terminou durante a execução')
+
+    recovered = stale.update({
+        MediaJob.status: 'queued',
+        MediaJob.locked_by: None,
+        MediaJob.locked_at: None
+    }, synchronize_session=False)
+    db.session.commit()
+    return recovered
+
+
+def release_worker_jobs(worker_id):
+    """Devolver à fila as tarefas de um worker que terminou inesperadamente"""
+    running = MediaJob.query.filter_by(status='running', locked_by=worker_id)
+
+    # Um ficheiro que derruba o worker (ex.: segfault no Pillow ou no ffprobe) não volta sempre à fila
+    fail_exhausted_jobs(running, 'Worker terminou durante a execução')
+
+    released = running.update({
+        MediaJob.status: 'queued',
+        MediaJob.locked_by: None,
+        MediaJob.locked_at: None
+    }, synchronize_session=False)
+    db.session.commit()
+    return released
+
+
+def process_inline(job):
+    """Executar já uma tarefa acabada de criar (modo MEDIA_PROCESSING_INLINE)"""
+    job.status = 'running'
+    job.attempts = 1
+    db.session.commit()
+    run_job(job)
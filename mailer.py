@@ -0,0 +1,356 @@
+import argparse
+import json
+import os
+import secrets
+import smtplib
+import threading
+import time
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from flask import current_app
+
+# Outbox em disco: queue/ (à espera), sending/ (reservadas por um sender), failed/ (desistidas)
+# O nome de cada ficheiro começa pela hora do próximo envio, para a listagem sair já ordenada
+QUEUE, SENDING, FAILED = 'queue', 'sending', 'failed'
+
+_sender = None
+_sender_lock = threading.Lock()
+
+
+def outbox_path(*parts):
+    """Caminho dentro da pasta da outbox"""
+    return os.path.join(current_app.config['MAIL_OUTBOX_FOLDER'], *parts)
+
+
+def message_filename(message):
+    """Nome do ficheiro de uma mensagem: <próximo envio em ms>-<id>.json"""
+    return f"{int(message['next_attempt'] * 1000):013d}-{message['id']}.json"
+
+
+def write_message(message, folder=QUEUE):
+    """Gravar uma mensagem na outbox (escrita atómica: ficheiro temporário + rename)"""
+    os.makedirs(outbox_path(folder), exist_ok=True)
+    path = outbox_path(folder, message_filename(message))
+    tmp_path = outbox_path(folder, f".{message['id']}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(message, f)
+    os.replace(tmp_path, path)
+    return path
+
+
+def smtp_configured():
+    """Verificar se há um servidor SMTP e um remetente definidos"""
+    return bool(current_app.config['SMTP_SERVER'] and current_app.config['SMTP_EMAIL'])
+
+
+def queue_email(to, subject, html, text=None):
+    """Pôr uma mensagem na outbox e acordar o sender (não espera pelo envio)"""
+    message = {
+        'id': secrets.token_hex(8),
+        'to': to,
+        'subject': subject,
+        'html': html,
+        'text': text,
+        'attempts': 0,
+        'next_attempt': time.time(),
+        'last_error': None,
+    }
+    write_message(message)
+
+    if current_app.config['MAIL_SENDER_THREAD']:
+        start_mail_sender(current_app._get_current_object()).wake()
+    return message['id']
+
+
+def queue_validation_email(user_email, username, validation_token):
+    """Pôr na outbox o email de validação (False se o SMTP não estiver configurado)"""
+    if not smtp_configured():
+        print("AVISO: Configurações SMTP não definidas. Email não enviado.")
+        return False
+
+    # Templates compilados uma única vez pelo Jinja e reutilizados
+    jinja_env = current_app.jinja_env
+    context = {
+        'username': username,
+        'validation_link': f"{current_app.config['APP_URL']}/validate/{validation_token}",
+    }
+    queue_email(
+        user_email,
+        'Discover Lisboa - Validação de Conta',
+        jinja_env.get_template('email/validation.html').render(context),
+        jinja_env.get_template('email/validation.txt').render(context),
+    )
+    print(f"Email de validação em fila para: {user_email}")
+    return True
+
+
+def build_mime(message, sender_email):
+    """Construir a mensagem MIME (texto simples + HTML)"""
+    mime = MIMEMultipart('alternative')
+    mime['Subject'] = message['subject']
+    mime['From'] = sender_email
+    mime['To'] = message['to']
+    if message.get('text'):
+        mime.attach(MIMEText(message['text'], 'plain', 'utf-8'))
+    mime.attach(MIMEText(message['html'], 'html', 'utf-8'))
+    return mime.as_string()
+
+
+class MailSender:
+    """Envio da outbox em segundo plano, com uma ligação SMTP autenticada reutilizada"""
+
+    def __init__(self, app):
+        self.app = app
+        self.connection = None
+        self.last_used = 0
+        self.event = threading.Event()
+        self.thread = None
+        self.running = False
+
+    # Ligação SMTP persistente
+
+    def check_connection(self):
+        """Descartar a ligação se o servidor a tiver fechado entretanto"""
+        if self.connection is None:
+            return
+        try:
+            self.connection.noop()
+        except (smtplib.SMTPException, OSError):
+            self.disconnect()
+
+    def connect(self):
+        """Abrir (ou reutilizar) a ligação SMTP autenticada"""
+        if self.connection is not None:
+            return self.connection
+
+        config = self.app.config
+        connection = smtplib.SMTP(config['SMTP_SERVER'], config['SMTP_PORT'], timeout=config['SMTP_TIMEOUT'])
+        try:
+            if config['SMTP_USE_TLS']:
+                connection.starttls()
+            if config['SMTP_PASSWORD']:
+                connection.login(config['SMTP_EMAIL'], config['SMTP_PASSWORD'])
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+            raise
+        self.connection = connection
+        return connection
+
+    def disconnect(self):
+        """Fechar a ligação SMTP"""
+        if self.connection is None:
+            return
+        try:
+            self.connection.quit()
+        except (smtplib.SMTPException, OSError):
+            self.connection.close()
+        self.connection = None
+
+    # Fila
+
+    def claim_batch(self):
+        """Reservar (rename para sending/) as mensagens prontas a enviar"""
+        queue_folder = outbox_path(QUEUE)
+        if not os.path.isdir(queue_folder):
+            return []
+
+        now_ms = int(time.time() * 1000)
+        os.makedirs(outbox_path(SENDING), exist_ok=True)
+        claimed = []
+        for filename in sorted(os.listdir(queue_folder)):
+            if filename.startswith('.'):
+                continue
+            if int(filename.split('-', 1)[0]) > now_ms or len(claimed) >= self.app.config['MAIL_BATCH_SIZE']:
+                break
+            path = outbox_path(SENDING, filename)
+            try:
+                # O rename é atómico: só um sender fica com cada mensagem
+                os.rename(os.path.join(queue_folder, filename), path)
+            except FileNotFoundError:
+                continue
+            os.utime(path)  # hora da reserva (ver recover_stale)
+            claimed.append(path)
+        return claimed
+
+    def retry_later(self, path, message, error):
+        """Voltar a pôr a mensagem na fila com espera exponencial (ou desistir)"""
+        config = self.app.config
+        message['attempts'] += 1
+        message['last_error'] = str(error)
+        if message['attempts'] >= config['MAIL_MAX_ATTEMPTS']:
+            write_message(message, FAILED)
+            print(f"Email para {message['to']} desistido após {message['attempts']} tentativas: {error}")
+        else:
+            message['next_attempt'] = time.time() + config['MAIL_RETRY_DELAY'] * 2 ** (message['attempts'] - 1)
+            write_message(message)
+        os.remove(path)
+
+    def discard(self, path, error, message=None):
+        """Passar uma mensagem inválida para failed/ (sem novas tentativas)"""
+        try:
+            message['attempts'] = message.get('attempts', 0) + 1
+            message['last_error'] = repr(error)
+            write_message(message, FAILED)
+            os.remove(path)
+        except Exception:
+            # Ficheiro ilegível ou mensagem incompleta: guardado tal como está
+            os.makedirs(outbox_path(FAILED), exist_ok=True)
+            os.replace(path, outbox_path(FAILED, os.path.basename(path)))
+        print(f"Email em {os.path.basename(path)} desistido: {error!r}")
+
+    def send_batch(self):
+        """Enviar um lote de mensagens pela mesma ligação; devolve quantas foram tratadas"""
+        paths = self.claim_batch()
+        if not paths:
+            return 0
+
+        # Uma verificação da ligação por lote, não por mensagem
+        self.check_connection()
+        sender_email = self.app.config['SMTP_EMAIL']
+        for path in paths:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    message = json.load(f)
+            except (OSError, ValueError) as e:
+                self.discard(path, e)
+                continue
+            try:
+                connection = self.connect()
+                connection.sendmail(sender_email, [message['to']], build_mime(message, sender_email))
+            except smtplib.SMTPRecipientsRefused as e:
+                # Endereço recusado: tentar de novo não adianta
+                message['attempts'] = self.app.config['MAIL_MAX_ATTEMPTS'] - 1
+                self.retry_later(path, message, e)
+            except (smtplib.SMTPException, OSError) as e:
+                self.disconnect()
+                self.retry_later(path, message, e)
+            except Exception as e:
+                # Mensagem que nunca poderá ser enviada (ex.: endereço não ASCII, campos em falta)
+                self.disconnect()
+                self.discard(path, e, message)
+            else:
+                os.remove(path)
+                print(f"Email enviado para: {message['to']}")
+        self.last_used = time.time()
+        return len(paths)
+
+    def recover_stale(self):
+        """Devolver à fila mensagens reservadas por um sender que terminou a meio"""
+        sending_folder = outbox_path(SENDING)
+        if not os.path.isdir(sending_folder):
+            return 0
+        limit = time.time() - self.app.config['MAIL_LOCK_TIMEOUT']
+        recovered = 0
+        for filename in os.listdir(sending_folder):
+            path = os.path.join(sending_folder, filename)
+            try:
+                if os.path.getmtime(path) < limit:
+                    os.rename(path, outbox_path(QUEUE, filename))
+                    recovered += 1
+            except FileNotFoundError:
+                continue
+        return recovered
+
+    def next_due(self):
+        """Segundos até à próxima mensagem da fila (None se estiver vazia)"""
+        queue_folder = outbox_path(QUEUE)
+        if not os.path.isdir(queue_folder):
+            return None
+        names = [name for name in os.listdir(queue_folder) if not name.startswith('.')]
+        if not names:
+            return None
+        return max(0.0, int(min(names).split('-', 1)[0]) / 1000 - time.time())
+
+    def flush(self):
+        """Enviar tudo o que está pronto (lote a lote) e fechar a ligação"""
+        with self.app.app_context():
+            total = 0
+            while True:
+                sent = self.send_batch()
+                if not sent:
+                    break
+                total += sent
+            self.disconnect()
+        return total
+
+    # Ciclo em segundo plano
+
+    def wake(self):
+        """Acordar o sender (há mensagens novas)"""
+        self.event.set()
+
+    def run(self):
+        """Ciclo do sender: enviar lotes, esperar por mensagens novas ou pelo próximo reenvio"""
+        config = self.app.config
+        with self.app.app_context():
+            self.recover_stale()
+            while self.running:
+                timeout = config['MAIL_POLL_INTERVAL']
+                try:
+                    while self.send_batch():
+                        pass
+                    # Mensagens presas em sending/ (erro inesperado ou outro sender que terminou)
+                    self.recover_stale()
+
+                    # Não manter a ligação aberta sem uso (o servidor acabaria por fechá-la)
+                    if self.connection is not None and time.time() - self.last_used > config['MAIL_IDLE_TIMEOUT']:
+                        self.disconnect()
+
+                    due = self.next_due()
+                    if due is not None:
+                        timeout = min(timeout, due)
+                except Exception as e:
+                    # O sender continua; o que ficou em sending/ volta à fila após MAIL_LOCK_TIMEOUT
+                    self.disconnect()
+                    print(f"Erro no envio de emails: {e!r}")
+                self.event.wait(timeout)
+                self.event.clear()
+            self.disconnect()
+
+    def start(self):
+        """Iniciar o sender numa thread em segundo plano"""
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name='mail-sender', daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Parar o sender depois do lote atual"""
+        self.running = False
+        self.wake()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def start_mail_sender(app):
+    """Obter o sender em segundo plano deste processo (iniciado no primeiro email)"""
+    global _sender
+    with _sender_lock:
+        if _sender is None or not _sender.thread.is_alive():
+            _sender = MailSender(app).start()
+    return _sender
+
+
+def main():
+    """Enviar os emails da outbox num processo próprio (ou só uma vez com --once)"""
+    parser = argparse.ArgumentParser(description='Envio de emails da outbox do Discover Lisboa')
+    parser.add_argument('--once', action='store_true', help='enviar o que está na fila e terminar')
+    args = parser.parse_args()
+
+    from app import app
+
+    sender = MailSender(app)
+    if args.once:
+        print(f"{sender.flush()} email(s) tratados.")
+        return
+
+    sender.running = True
+    print("Sender de emails a correr. Ctrl+C para terminar.")
+    try:
+        sender.run()
+    except KeyboardInterrupt:
+        sender.running = False
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+import hashlib
+import os
+import re
+import tempfile
+from flask import current_app
+from PIL import Image, ImageOps
+from models import db, MediaBlob
+
+# Formato de recurso (para browsers sem WebP) consoante o original
+FALLBACK_FORMATS = {
+    'jpg': ('JPEG', 'jpg'),
+    'jpeg': ('JPEG', 'jpg'),
+    'png': ('PNG', 'png'),
+    'gif': ('PNG', 'png'),
+}
+
+
+# Ficheiros cujo nome é o hash do conteúdo nunca mudam (cache longa)
+IMMUTABLE_MEDIA = re.compile(r'^(derivatives/)?[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}[\w.]*$')
+
+
+def is_immutable_media(filename):
+    """Verificar se o ficheiro está guardado pelo hash do conteúdo"""
+    return IMMUTABLE_MEDIA.match(filename) is not None
+
+
+def upload_path(filename):
+    """Caminho em disco de um ficheiro guardado em UPLOAD_FOLDER"""
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+
+
+def blob_filename(digest, ext):
+    """Caminho endereçado pelo conteúdo: ab/cd/<sha256>.<ext>"""
+    return f'{digest[:2]}/{digest[2:4]}/{digest}.{ext}'
+
+
+def store_blob(stream, ext, acquire=True):
+    """Guardar um ficheiro calculando o SHA-256 enquanto é escrito
+
+    Se já existir um ficheiro com o mesmo conteúdo, a cópia é descartada e o
+    ficheiro existente é reutilizado. Devolve o caminho relativo a UPLOAD_FOLDER.
+    Com acquire, a referência ao ficheiro fica registada na transação atual
+    (ver place_blob).
+    """
+    folder = current_app.config['UPLOAD_FOLDER']
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    digest = hashlib.sha256()
+
+    # Escrever num ficheiro temporário na mesma pasta (o os.replace é atómico)
+    fd, tmp_path = tempfile.mkstemp(prefix='.upload-', dir=folder)
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                tmp.write(chunk)
+
+        return place_blob(tmp_path, digest.hexdigest(), ext, acquire)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def place_blob(tmp_path, digest, ext, acquire=True):
+    """Mover um ficheiro já escrito (e com hash calculado) para o armazenamento
+
+    A referência é registada antes de decidir se o ficheiro existente pode ser
+    reutilizado: um delete_unused_media concorrente ou espera pelo commit (e
+    encontra a contagem acima de zero) ou já removeu o ficheiro, e a cópia
+    nova ocupa o seu lugar.
+    """
+    filename = blob_filename(digest, ext)
+    path = upload_path(filename)
+    if acquire:
+        acquire_blob(filename, os.path.getsize(tmp_path))
+    if os.path.exists(path):
+        os.remove(tmp_path)
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(tmp_path, path)
+    return filename
+
+
+def acquire_blob(filename, size=None):
+    """Registar mais uma referência a um ficheiro (antes do commit)"""
+    updated = MediaBlob.query.filter_by(filename=filename).update(
+        {MediaBlob.refcount: MediaBlob.refcount + 1}, synchronize_session=False)
+    if not updated:
+        if size is None:
+            path = upload_path(filename)
+            size = os.path.getsize(path) if os.path.exists(path) else None
+        db.session.add(MediaBlob(filename=filename, size=size, refcount=1))
+        db.session.flush()
+
+
+def release_blob(filename):
+    """Retirar uma referência a um ficheiro (antes do commit)"""
+    if filename:
+        MediaBlob.query.filter_by(filename=filename).update(
+            {MediaBlob.refcount: MediaBlob.refcount - 1}, synchronize_session=False)
+
+
+def delete_unused_media(filename, variants=None):
+    """Remover o ficheiro e os derivados se já nenhum conteúdo os usar (após o commit)"""
+    if not filename:
+        return
+
+    blob = db.session.get(MediaBlob, filename)
+    if blob is None:
+        # Ficheiros sem registo são anteriores ao armazenamento por conteúdo
+        delete_media(filename, variants)
+        return
+
+    # DELETE condicional: só remove se a contagem continuar a zero. Os ficheiros
+    # são apagados antes do commit, enquanto a linha está bloqueada: um
+    # place_blob concorrente espera e volta a colocar o ficheiro
+    deleted = MediaBlob.query.filter(
+        MediaBlob.filename == filename,
+        MediaBlob.refcount <= 0
+    ).delete(synchronize_session=False)
+    if deleted:
+        try:
+            delete_media(filename, variants)
+        except OSError:
+            db.session.rollback()
+            raise
+    db.session.commit()
+
+
+def _save_variant(image, path, image_format, quality):
+    """Guardar uma variante sem metadados EXIF"""
+    options = {'optimize': True}
+    if image_format in ('JPEG', 'WEBP'):
+        options['quality'] = quality
+    if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    # Sem o argumento exif o Pillow não copia os metadados do original
+    image.save(path, image_format, **options)
+
+
+def generate_image_derivatives(filename):
+    """Gerar larguras fixas (formato original + WebP) de uma imagem carregada
+
+    Devolve a lista de variantes [{'width', 'webp', 'src'}] com caminhos
+    relativos a UPLOAD_FOLDER, ou None se a imagem não tiver derivados (ex.:
+    GIF animado). Erros de leitura ou escrita são propagados, para a tarefa
+    ser repetida (ver jobs.run_job).
+    """
+    ext = filename.rsplit('.', 1)[-1].lower()
+    if ext not in FALLBACK_FORMATS:
+        return None
+
+    config = current_app.config
+    folder = config['IMAGE_DERIVATIVES_FOLDER']
+
+    fallback_format, fallback_ext = FALLBACK_FORMATS[ext]
+    quality = config['IMAGE_DERIVATIVE_QUALITY']
+    stem = filename.rsplit('.', 1)[0]
+    os.makedirs(os.path.dirname(upload_path(f'{folder}/{stem}')), exist_ok=True)
+
+    with Image.open(upload_path(filename)) as original:
+        if getattr(original, 'is_animated', False):
+            return None
+
+        # Aplicar a rotação indicada no EXIF antes de o descartar
+        image = ImageOps.exif_transpose(original)
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+
+        # Larguras menores que o original (ou só a original, se for pequena)
+        widths = [w for w in config['IMAGE_DERIVATIVE_WIDTHS'] if w < image.width]
+        if not widths:
+            widths = [image.width]
+
+        variants = []
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.LANCZOS)
+
+            webp_name = f'{folder}/{stem}_{width}.webp'
+            src_name = f'{folder}/{stem}_{width}.{fallback_ext}'
+            _save_variant(resized, upload_path(webp_name), 'WEBP', quality)
+            _save_variant(resized, upload_path(src_name), fallback_format, quality)
+
+            variants.append({'width': width, 'webp': webp_name, 'src': src_name})
+
+    return variants
+
+
+def delete_media(filename, variants=None):
+    """Remover um ficheiro carregado e os respetivos derivados"""
+    paths = [filename] if filename else []
+    for variant in variants or []:
+        paths.extend([variant['webp'], variant['src']])
+
+    for path in paths:
+        file_path = upload_path(path)
+        if os.path.exists(file_path):
+            os.remove(file_path)
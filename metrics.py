@@ -0,0 +1,196 @@
+import threading
+import time
+from flask import Blueprint, Response, current_app, g, has_request_context, request, template_rendered, \
+    before_render_template
+from sqlalchemy import event
+
+metrics_bp = Blueprint('metrics', __name__)
+
+# Limites (em segundos) dos histogramas de latência
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    """Escapar o valor de uma label no formato de texto do Prometheus"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=None):
+    """Labels de uma série: {nome="valor",...}"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Contador monotónico com labels"""
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1, *label_values):
+        """Somar amount à série com as labels indicadas"""
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def expose(self):
+        """Linhas no formato de texto do Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self.lock:
+            for label_values, value in sorted(self.values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labels, label_values)} {value}')
+        return lines
+
+
+class Histogram:
+    """Histograma cumulativo (buckets, soma e contagem) com labels"""
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [contagens por bucket, soma, contagem]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """Registar uma observação na série com as labels indicadas"""
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def expose(self):
+        """Linhas no formato de texto do Prometheus"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self.lock:
+            for label_values, (counts, total, count) in sorted(self.series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labels, label_values, f'le="{bound}"')
+                    lines.append(f'{self.name}_bucket{labels} {bucket_count}')
+                labels = _format_labels(self.labels, label_values, 'le="+Inf"')
+                lines.append(f'{self.name}_bucket{labels} {count}')
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f'{self.name}_sum{labels} {total}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+# Métricas do processo (cada worker do servidor web tem as suas)
+REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Duração dos pedidos HTTP', ('endpoint', 'method', 'status'))
+REQUEST_QUERIES = Histogram(
+    'http_request_db_queries', 'Queries SQL por pedido HTTP', ('endpoint',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+DB_QUERIES = Counter('db_queries_total', 'Queries SQL executadas')
+DB_QUERY_DURATION = Histogram('db_query_duration_seconds', 'Duração das queries SQL')
+TEMPLATE_DURATION = Histogram('template_render_duration_seconds', 'Duração da renderização de templates',
+                              ('template',))
+UPLOAD_BYTES = Counter('upload_bytes_total', 'Bytes recebidos em uploads', ('kind',))
+UPLOAD_DURATION = Histogram('upload_duration_seconds', 'Duração da receção de uploads', ('kind',))
+SLOW_REQUESTS = Counter('http_slow_requests_total', 'Pedidos acima de METRICS_SLOW_REQUEST', ('endpoint',))
+
+REGISTRY = [REQUEST_DURATION, REQUEST_QUERIES, DB_QUERIES, DB_QUERY_DURATION, TEMPLATE_DURATION,
+            UPLOAD_BYTES, UPLOAD_DURATION, SLOW_REQUESTS]
+
+
+def observe_upload(kind, size, started):
+    """Registar um upload recebido (bytes e duração desde started)"""
+    UPLOAD_BYTES.inc(size, kind)
+    UPLOAD_DURATION.observe(time.perf_counter() - started, kind)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Guardar o início da query no contexto de execução (descartado com ele, mesmo se falhar)"""
+    context._metrics_query_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    """Contar a query e somar a duração ao pedido atual"""
+    elapsed = time.perf_counter() - context._metrics_query_start
+    DB_QUERIES.inc()
+    DB_QUERY_DURATION.observe(elapsed)
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_query_time += elapsed
+
+
+def _before_render_template(sender, template, context, **extra):
+    """Guardar o início da renderização"""
+    if has_request_context():
+        g.setdefault('metrics_templates', []).append(time.perf_counter())
+
+
+def _template_rendered(sender, template, context, **extra):
+    """Registar a duração da renderização"""
+    if has_request_context() and g.get('metrics_templates'):
+        elapsed = time.perf_counter() - g.metrics_templates.pop()
+        TEMPLATE_DURATION.observe(elapsed, template.name or 'string')
+        g.metrics_template_time = g.get('metrics_template_time', 0.0) + elapsed
+
+
+def start_request_timer():
+    """Iniciar a medição do pedido"""
+    g.metrics_start = time.perf_counter()
+    g.metrics_queries = 0
+    g.metrics_query_time = 0.0
+
+
+def record_request(response):
+    """Registar a duração do pedido, o Server-Timing e os pedidos lentos"""
+    if 'metrics_start' not in g:
+        return response
+
+    elapsed = time.perf_counter() - g.metrics_start
+    endpoint = request.endpoint or 'unknown'
+    REQUEST_DURATION.observe(elapsed, endpoint, request.method, response.status_code)
+    REQUEST_QUERIES.observe(g.metrics_queries, endpoint)
+
+    config = current_app.config
+    if config['METRICS_SERVER_TIMING']:
+        timings = [
+            f'db;desc="{g.metrics_queries} queries";dur={g.metrics_query_time * 1000:.1f}',
+            f'total;dur={elapsed * 1000:.1f}',
+        ]
+        if 'metrics_template_time' in g:
+            timings.insert(1, f'tpl;dur={g.metrics_template_time * 1000:.1f}')
+        response.headers.add('Server-Timing', ', '.join(timings))
+
+    if elapsed >= config['METRICS_SLOW_REQUEST']:
+        SLOW_REQUESTS.inc(1, endpoint)
+        print(f"Pedido lento: {request.method} {request.path} ({endpoint}) {elapsed * 1000:.0f} ms, "
+              f"{g.metrics_queries} queries em {g.metrics_query_time * 1000:.0f} ms")
+    return response
+
+
+def init_metrics(app, engine):
+    """Ligar a instrumentação à aplicação (pedidos, templates) e ao engine (queries)"""
+    app.before_request(start_request_timer)
+    app.after_request(record_request)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render_template, app)
+    template_rendered.connect(_template_rendered, app)
+
+
+@metrics_bp.route('/metrics')
+def metrics():
+    """Métricas deste processo no formato de texto do Prometheus"""
+    token = current_app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return Response('Não autorizado\n', status=401, mimetype='text/plain')
+
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.expose())
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,88 @@
+import argparse
+import importlib.util
+import os
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+
+# Migrações versionadas: migrations/NNNN_descricao.py com uma função upgrade(conn)
+MIGRATIONS_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATIONS_TABLE = 'schema_migrations'
+
+
+def load_migrations(folder=MIGRATIONS_FOLDER):
+    """Carregar as migrações da pasta, pela ordem da versão: [(versão, módulo)]"""
+    migrations = []
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith('.py') or not filename[:4].isdigit():
+            continue
+        version = filename[:-3]
+        spec = importlib.util.spec_from_file_location(f'migrations.{version}', os.path.join(folder, filename))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        migrations.append((version, module))
+    return migrations
+
+
+def ensure_migrations_table(engine):
+    """Criar a tabela que regista as migrações já aplicadas"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+            "version VARCHAR(255) PRIMARY KEY, applied_at TIMESTAMP NOT NULL)"
+        ))
+
+
+def applied_versions(engine):
+    """Versões já aplicadas a esta base de dados"""
+    ensure_migrations_table(engine)
+    with engine.connect() as conn:
+        return {row[0] for row in conn.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+
+def run_migrations(engine):
+    """Aplicar as migrações em falta, cada uma na sua transação; devolve as versões aplicadas"""
+    done = applied_versions(engine)
+    applied = []
+
+    for version, module in load_migrations():
+        if version in done:
+            continue
+        try:
+            with engine.begin() as conn:
+                module.upgrade(conn)
+                conn.execute(
+                    text(f"INSERT INTO {MIGRATIONS_TABLE} (version, applied_at) VALUES (:version, :applied_at)"),
+                    {'version': version, 'applied_at': datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Outro processo aplicou a mesma migração em simultâneo
+            continue
+        print(f"Migração aplicada: {version}")
+        applied.append(version)
+
+    return applied
+
+
+def main():
+    """Aplicar as migrações em falta ou mostrar o estado (python migrate.py [status])"""
+    parser = argparse.ArgumentParser(description='Migrações da base de dados do Discover Lisboa')
+    parser.add_argument('command', nargs='?', choices=('upgrade', 'status'), default='upgrade')
+    args = parser.parse_args()
+
+    from app import app, db
+
+    with app.app_context():
+        if args.command == 'status':
+            done = applied_versions(db.engine)
+            for version, module in load_migrations():
+                mark = 'x' if version in done else ' '
+                print(f"[{mark}] {version} - {(module.__doc__ or '').strip()}")
+            return
+
+        if not run_migrations(db.engine):
+            print("Base de dados atualizada, sem migrações pendentes.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,20 @@
+"""Índices para as listagens, filtros do mapa, validação de email e fila de média"""
+from sqlalchemy import text
+
+# (nome, tabela, colunas): os mesmos nomes declarados em models.py
+INDEXES = [
+    ('ix_contents_created_at_id', 'contents', 'created_at, id'),
+    ('ix_contents_user_id_created_at_id', 'contents', 'user_id, created_at, id'),
+    ('ix_contents_category_created_at_id', 'contents', 'category, created_at, id'),
+    ('ix_contents_latitude_longitude', 'contents', 'latitude, longitude'),
+    ('ix_contents_media_filename', 'contents', 'media_filename'),
+    ('ix_users_validation_token', 'users', 'validation_token'),
+    ('ix_media_jobs_status_run_after', 'media_jobs', 'status, run_after, id'),
+    ('ix_chunked_uploads_created_at', 'chunked_uploads', 'created_at'),
+]
+
+
+def upgrade(conn):
+    """Criar os índices (IF NOT EXISTS: bases de dados novas já os têm do create_all)"""
+    for name, table, columns in INDEXES:
+        conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})"))
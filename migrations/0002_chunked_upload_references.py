@@ -0,0 +1,22 @@
+"""Referências dos uploads por blocos finalizados e ainda não associados a um conteúdo"""
+from datetime import datetime
+from sqlalchemy import text
+
+
+def upgrade(conn):
+    """A partir desta versão o finalize regista a referência: acrescentá-la aos uploads pendentes"""
+    rows = conn.execute(text(
+        "SELECT media_filename, COUNT(*) FROM chunked_uploads "
+        "WHERE status = 'complete' AND media_filename IS NOT NULL GROUP BY media_filename"
+    )).all()
+    for filename, count in rows:
+        updated = conn.execute(
+            text("UPDATE media_blobs SET refcount = refcount + :count WHERE filename = :filename"),
+            {'count': count, 'filename': filename}
+        ).rowcount
+        if not updated:
+            conn.execute(
+                text("INSERT INTO media_blobs (filename, size, refcount, created_at) "
+                     "VALUES (:filename, NULL, :count, :created_at)"),
+                {'filename': filename, 'count': count, 'created_at': datetime.utcnow()}
+            )
@@ -1,13 +1,49 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import event, inspect, text
 from datetime import datetime
 
 db = SQLAlchemy()
 
+
+def configure_engine(pragmas):
+    """Aplicar os PRAGMAs indicados a cada nova ligação SQLite (sem efeito noutras bases de dados)"""
+    if db.engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(db.engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+def add_missing_columns():
+    """Acrescentar às tabelas existentes as colunas novas dos modelos
+
+    O create_all() só cria tabelas em falta; colunas adicionadas depois a um
+    modelo têm de ser criadas com ALTER TABLE numa base de dados já existente.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
 class User(UserMixin, db.Model):
     """Modelo de utilizador"""
     __tablename__ = 'users'
+    __table_args__ = (
+        db.Index('ix_users_validation_token', 'validation_token'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -36,6 +72,14 @@ class User(UserMixin, db.Model):
 class Content(db.Model):
     """Modelo de conteúdo turístico/gastronómico"""
     __tablename__ = 'contents'
+    __table_args__ = (
+        # Listagens por data (página inicial, API) e por autor (dashboard), com id como desempate
+        db.Index('ix_contents_created_at_id', 'created_at', 'id'),
+        db.Index('ix_contents_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_contents_category_created_at_id', 'category', 'created_at', 'id'),
+        db.Index('ix_contents_latitude_longitude', 'latitude', 'longitude'),
+        db.Index('ix_contents_media_filename', 'media_filename'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -46,6 +90,10 @@ class Content(db.Model):
     latitude = db.Column(db.Float, nullable=True)
     longitude = db.Column(db.Float, nullable=True)
     location_name = db.Column(db.String(200), nullable=True)
+    media_variants = db.Column(db.JSON, nullable=True)  # derivados da imagem (larguras, WebP)
+    media_poster = db.Column(db.String(255), nullable=True)  # frame de pré-visualização (vídeo)
+    media_duration = db.Column(db.Float, nullable=True)  # duração em segundos (vídeo/áudio)
+    processing_status = db.Column(db.String(20), default='ready')  # pending, ready, failed
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -64,9 +112,104 @@ class Content(db.Model):
             'latitude': self.latitude,
             'longitude': self.longitude,
             'location_name': self.location_name,
+            'media_variants': self.media_variants,
+            'media_poster': self.media_poster,
+            'media_duration': self.media_duration,
             'created_at': self.created_at.isoformat(),
             'author': self.author.username
         }
     
     def __repr__(self):
         return f'<Content {self.title}>'
+
+
+class AppState(db.Model):
+    """Contadores globais partilhados entre processos (ex.: versão dos conteúdos)"""
+    __tablename__ = 'app_state'
+    
+    key = db.Column(db.String(50), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<AppState {self.key}={self.value}>'
+
+
+class TileVersion(db.Model):
+    """Versão dos conteúdos da última escrita que alterou cada tile vetorial"""
+    __tablename__ = 'tile_versions'
+    
+    z = db.Column(db.Integer, primary_key=True)
+    x = db.Column(db.Integer, primary_key=True)
+    y = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<TileVersion {self.z}/{self.x}/{self.y}={self.version}>'
+
+
+class MediaJob(db.Model):
+    """Tarefa de processamento de média (fila local, executada pelo worker.py)"""
+    __tablename__ = 'media_jobs'
+    __table_args__ = (
+        db.Index('ix_media_jobs_status_run_after', 'status', 'run_after', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # image_derivatives, video_poster, audio_duration
+    content_id = db.Column(db.Integer, nullable=False)
+    media_filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_at = db.Column(db.DateTime, nullable=True)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaJob {self.kind} {self.content_id} {self.status}>'
+
+
+class MediaBlob(db.Model):
+    """Ficheiro carregado, guardado pelo SHA-256 do conteúdo e partilhado entre conteúdos"""
+    __tablename__ = 'media_blobs'
+    
+    filename = db.Column(db.String(255), primary_key=True)  # ab/cd/<sha256>.<ext>
+    size = db.Column(db.Integer, nullable=True)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<MediaBlob {self.filename} ({self.refcount})>'
+
+
+class ChunkedUpload(db.Model):
+    """Upload enviado por blocos (pode ser retomado a partir do último offset)"""
+    __tablename__ = 'chunked_uploads'
+    __table_args__ = (
+        db.Index('ix_chunked_uploads_created_at', 'created_at'),
+    )
+    
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)  # nome original
+    size = db.Column(db.Integer, nullable=False)  # tamanho total anunciado
+    offset = db.Column(db.Integer, nullable=False, default=0)  # bytes já recebidos
+    sha256 = db.Column(db.String(64), nullable=True)  # checksum indicado pelo cliente
+    status = db.Column(db.String(20), nullable=False, default='uploading')  # uploading, complete, attached
+    media_filename = db.Column(db.String(255), nullable=True)  # ficheiro final (após finalize)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        """Converter para dicionário (estado do upload)"""
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.offset,
+            'status': self.status
+        }
+    
+    def __repr__(self):
+        return f'<ChunkedUpload {self.id} {self.offset}/{self.size}>'
@@ -0,0 +1,309 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import timezone
+from functools import wraps
+from flask import current_app, request, session, make_response, copy_current_request_context
+from flask_login import current_user
+from markupsafe import Markup
+from cache import get_content_version, TTLCache
+
+
+class MemoryBackend:
+    """Entradas em memória (LRU, por processo)"""
+
+    def __init__(self, maxsize):
+        self.cache = TTLCache(maxsize)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, timeout):
+        self.cache.set(key, value, timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+class FileSystemBackend:
+    """Entradas numa pasta partilhada pelos processos (um ficheiro por chave)
+
+    A data de modificação de cada ficheiro é a hora de expiração: a limpeza
+    só precisa de os.scandir, sem ler as entradas.
+    """
+
+    def __init__(self, directory, maxsize):
+        self.directory = directory
+        self.maxsize = maxsize
+        # Limpeza a cada maxsize / 10 escritas (o limite pode ser excedido em 10% por processo)
+        self.prune_every = max(1, maxsize // 10)
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode()).hexdigest() + '.cache')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return value if expires > time.time() else None
+
+    def set(self, key, value, timeout):
+        # Escrita atómica: os outros processos nunca leem um ficheiro a meio
+        expires = time.time() + timeout
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump((expires, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.utime(tmp_path, (expires, expires))
+        os.replace(tmp_path, self._path(key))
+        self.writes += 1
+        if self.writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Apagar as entradas expiradas e, acima de maxsize, as que expiram primeiro"""
+        now = time.time()
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.cache'):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        entries.sort()
+        excess = len(entries) - self.maxsize
+        for i, (expires, path) in enumerate(entries):
+            if expires > now and i >= excess:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.cache'):
+                os.remove(os.path.join(self.directory, name))
+
+
+class SQLiteBackend:
+    """Entradas numa base de dados SQLite própria, partilhada pelos processos"""
+
+    def __init__(self, path, maxsize):
+        self.path = path
+        self.maxsize = maxsize
+        self.prune_every = max(1, maxsize // 10)
+        self.writes = 0
+        self.local = threading.local()  # uma ligação por thread
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL NOT NULL, value BLOB NOT NULL)')
+
+    def _connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def set(self, key, value, timeout):
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, expires, value) VALUES (?, ?, ?)',
+            (key, time.time() + timeout, pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)))
+        self.writes += 1
+        if self.writes % self.prune_every == 0:
+            self.prune()
+
+    def prune(self):
+        """Apagar as entradas expiradas e, acima de maxsize, as que expiram primeiro"""
+        connection = self._connection()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires '
+            'LIMIT max(0, (SELECT count(*) FROM cache) - ?))', (self.maxsize,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+
+def make_backend(config):
+    """Criar o armazenamento indicado em PAGE_CACHE_BACKEND (ou None)"""
+    kind = config['PAGE_CACHE_BACKEND']
+    if kind == 'memory':
+        return MemoryBackend(config['PAGE_CACHE_SIZE'])
+    if kind == 'filesystem':
+        return FileSystemBackend(config['PAGE_CACHE_PATH'], config['PAGE_CACHE_SIZE'])
+    if kind == 'sqlite':
+        return SQLiteBackend(config['PAGE_CACHE_PATH'], config['PAGE_CACHE_SIZE'])
+    return None
+
+
+class PageCache:
+    """Páginas e fragmentos HTML por versão dos conteúdos, com stale-while-revalidate
+
+    Uma entrada está fresca enquanto a versão dos conteúdos não mudar e tiver
+    menos de PAGE_CACHE_TTL segundos. Depois disso ainda é servida durante
+    PAGE_CACHE_STALE segundos, enquanto uma thread a gera de novo.
+    """
+
+    def __init__(self):
+        self.backend = None  # criado no primeiro pedido
+        self.configured = False
+        self.refreshing = set()  # chaves a ser geradas em segundo plano neste processo
+        self.lock = threading.Lock()
+        self.local = threading.local()  # profundidade de geração na thread atual
+
+    def configure(self, config):
+        """Criar o armazenamento e ler os tempos de expiração"""
+        self.backend = make_backend(config)
+        self.ttl = config['PAGE_CACHE_TTL']
+        self.stale = config['PAGE_CACHE_STALE']
+        self.configured = True
+
+    def _state(self, entry, version, last_modified, now):
+        """'fresh', 'stale' (pode ser servida enquanto é gerada de novo) ou 'expired'"""
+        if entry['version'] == version:
+            if now - entry['created'] < self.ttl:
+                return 'fresh'
+            stale_since = entry['created'] + self.ttl
+        elif last_modified is not None:
+            stale_since = last_modified.replace(tzinfo=timezone.utc).timestamp()
+        else:
+            stale_since = entry['created']
+        return 'stale' if now - stale_since <= self.stale else 'expired'
+
+    def _store(self, key, version, value):
+        self.backend.set(key, {'version': version, 'created': time.time(), 'value': value},
+                         self.ttl + self.stale)
+
+    def _refresh(self, key, builder):
+        """Gerar a entrada de novo numa thread (uma de cada vez por chave)"""
+        with self.lock:
+            if key in self.refreshing:
+                return
+            self.refreshing.add(key)
+
+        @copy_current_request_context
+        def refresh():
+            try:
+                version, _ = get_content_version()
+                self._store(key, version, self._build(builder))
+            except Exception as e:
+                print(f"Erro ao atualizar a cache ({key}): {e}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get_or_build(self, key, builder):
+        """Obter o valor em cache ou gerá-lo com builder(); devolve (valor, estado)
+
+        O estado é 'hit', 'stale', 'miss' ou 'bypass' (cache desligada).
+        """
+        if not self.configured:
+            self.configure(current_app.config)
+        if self.backend is None:
+            return builder(), 'bypass'
+
+        version, last_modified = get_content_version()
+        entry = self.backend.get(key)
+        if entry is not None:
+            state = self._state(entry, version, last_modified, time.time())
+            if state == 'fresh':
+                return entry['value'], 'hit'
+            # Dentro da geração de outra entrada (ex.: fragmento de uma página) não se
+            # usam valores antigos: ficariam guardados com a versão nova
+            if state == 'stale' and not getattr(self.local, 'depth', 0):
+                self._refresh(key, builder)
+                return entry['value'], 'stale'
+
+        value = self._build(builder)
+        self._store(key, version, value)
+        return value, 'miss'
+
+    def _build(self, builder):
+        """Chamar builder() assinalando que esta thread está a gerar uma entrada"""
+        self.local.depth = getattr(self.local, 'depth', 0) + 1
+        try:
+            return builder()
+        finally:
+            self.local.depth -= 1
+
+    def fragment(self, name, builder):
+        """HTML de um fragmento (builder() devolve o HTML renderizado)"""
+        value, _ = self.get_or_build(f'fragment:{name}', lambda: str(builder()))
+        return Markup(value)
+
+    def clear(self):
+        """Descartar todas as entradas"""
+        if self.backend is not None:
+            self.backend.clear()
+
+
+page_cache = PageCache()
+
+
+def cached_page(name, key=None):
+    """Decorator: guardar a página em cache para visitantes anónimos
+
+    A barra de navegação depende do login, por isso utilizadores autenticados
+    (e pedidos com mensagens flash pendentes) recebem a página gerada na hora.
+    A resposta tem ETag: visitas repetidas recebem 304.
+
+    A entrada depende só de key() (ex.: o cursor da página), não da query
+    string: parâmetros que a vista ignora não criam entradas novas.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or current_user.is_authenticated or '_flashes' in session:
+                return view(*args, **kwargs)
+
+            # Só respostas 200 ficam em cache; as outras passam por uma exceção
+            def build():
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.direct_passthrough:
+                    raise _Uncacheable(response)
+                return response.get_data(), response.mimetype
+
+            variant = key() if key is not None else None
+            try:
+                (body, mimetype), state = page_cache.get_or_build(f'page:{name}:{variant or ""}', build)
+            except _Uncacheable as e:
+                return e.response
+
+            response = current_app.response_class(body, mimetype=mimetype)
+            response.headers['X-Cache'] = state.upper()
+            response.add_etag()
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+class _Uncacheable(Exception):
+    """Resposta que não deve ficar em cache (redirect, erro, 304...)"""
+
+    def __init__(self, response):
+        super().__init__(response.status)
+        self.response = response
@@ -0,0 +1,76 @@
+import base64
+from datetime import datetime
+from sqlalchemy import tuple_
+from models import Content
+from serializers import map_contents
+
+# Colunas mostradas nos cartões da página inicial e da dashboard
+LIST_COLUMNS = (
+    Content.id,
+    Content.title,
+    Content.description,
+    Content.category,
+    Content.media_type,
+    Content.media_filename,
+    Content.location_name,
+    Content.media_variants,
+    Content.media_poster,
+    Content.processing_status,
+    Content.created_at,
+)
+
+
+def encode_cursor(created_at, content_id):
+    """Cursor opaco com a posição (created_at, id) do último item de uma página"""
+    raw = f'{created_at.isoformat()}|{content_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Converter um cursor em (created_at, id); None se for inválido"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, content_id = raw.split('|')
+        return datetime.fromisoformat(created_at), int(content_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+def keyset_filter(query, position):
+    """Restringir uma query de Content aos itens depois de position, do mais recente para o mais antigo
+
+    Em vez de OFFSET (que lê e descarta as páginas anteriores), o índice
+    (created_at, id) é percorrido a partir da posição do cursor.
+    """
+    query = query.order_by(Content.created_at.desc(), Content.id.desc())
+    if position is not None:
+        query = query.filter(tuple_(Content.created_at, Content.id) < tuple_(*position))
+    return query
+
+
+def paginate(query, cursor=None, per_page=12):
+    """Uma página de conteúdos: (itens, cursor seguinte ou None)
+
+    Pede per_page + 1 linhas para saber se existe uma página seguinte.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    items = keyset_filter(query, position).limit(per_page + 1).all()
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        next_cursor = encode_cursor(items[-1].created_at, items[-1].id)
+    return items, next_cursor
+
+
+def paginate_map(query, cursor=None, per_page=100):
+    """Como paginate(), mas com os dicionários de map_contents() (API JSON)"""
+    position = decode_cursor(cursor) if cursor else None
+    items = map_contents(keyset_filter(query, position), per_page + 1)
+
+    next_cursor = None
+    if len(items) > per_page:
+        items = items[:per_page]
+        last = items[-1]
+        next_cursor = encode_cursor(datetime.fromisoformat(last['created_at']), last['id'])
+    return items, next_cursor
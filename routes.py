@@ -1,17 +1,59 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
+import math
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, make_response, current_app, send_from_directory
 from flask_login import login_required, current_user
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
 from models import db, Content
-from utils import save_uploaded_file, get_media_type
-import os
+from utils import save_uploaded_file, get_media_type, parse_coordinates
+from media import release_blob, delete_unused_media, is_immutable_media
+from jobs import enqueue_media_job, process_inline
+from uploads import claim_upload
+from serializers import map_contents, json_response, dumps, to_geojson
+from cache import bump_content_version, snapshot_cache, snapshot_response
+from page_cache import page_cache, cached_page
+from tiles import touch_tiles
+from search import search_contents_query
+from geocoder import geocoder
+from pagination import paginate, paginate_map, decode_cursor, LIST_COLUMNS
+from spatial import parse_bbox, filter_bbox, thin_by_zoom, cluster_index, nearest_contents, \
+    CLUSTER_MAX_ZOOM, CLUSTER_MAX_POINTS
 
 main_bp = Blueprint('main', __name__)
 
+
+@main_bp.app_template_filter('srcset')
+def srcset_filter(content, kind='webp'):
+    """Atributo srcset com os derivados de uma imagem ('webp' ou 'src')"""
+    return ', '.join(
+        f"{url_for('main.media', filename=variant[kind])} {variant['width']}w"
+        for variant in content.media_variants or []
+    )
+
+def index_cursor():
+    """Cursor da página inicial (None na primeira página)"""
+    # Cursores inválidos mostram a primeira página (e partilham a sua entrada na cache)
+    cursor = request.args.get('cursor')
+    if cursor and decode_cursor(cursor) is None:
+        return None
+    return cursor or None
+
+
 @main_bp.route('/')
+@cached_page('index', key=index_cursor)
 def index():
     """Página inicial"""
-    # Obter alguns conteúdos em destaque
-    featured_contents = Content.query.order_by(Content.created_at.desc()).limit(6).all()
-    return render_template('index.html', featured_contents=featured_contents)
+    cursor = index_cursor()
+    
+    def featured():
+        # Conteúdos mais recentes, por páginas (?cursor=), só com as colunas dos cartões
+        query = Content.query.options(load_only(*LIST_COLUMNS))
+        featured_contents, next_cursor = paginate(query, cursor, per_page=6)
+        return render_template('partials/featured_contents.html',
+                               featured_contents=featured_contents, next_cursor=next_cursor)
+    
+    # O fragmento não depende do login: também é reutilizado para utilizadores autenticados
+    featured_html = page_cache.fragment(f'featured:{cursor or ""}', featured)
+    return render_template('index.html', featured_html=featured_html)
 
 
 # @main_bp.route('/map')
@@ -24,25 +66,57 @@ def index():
 #     return render_template('map.html', contents=contents)
 
 @main_bp.route('/map')
+@cached_page('map')
 def map_view():
-    contents = Content.query.filter(
-        Content.latitude.isnot(None),
-        Content.longitude.isnot(None)
-    ).all()
+    """Mapa público (os conteúdos são carregados pela API conforme a área visível)"""
+    response = make_response(render_template('map.html'))
+    
+    # A página não depende dos dados: o browser só revalida (304) com o ETag
+    response.add_etag()
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
 
-    contents_json = [c.to_dict() for c in contents]
-    return render_template('map.html', contents=contents_json)
+
+@main_bp.route('/media/<path:filename>')
+def media(filename):
+    """Servir ficheiros carregados (Range/206, If-Range e ETag forte)"""
+    immutable = is_immutable_media(filename)
+    
+    # O nome dos ficheiros guardados por hash serve de ETag forte
+    response = send_from_directory(
+        current_app.config['UPLOAD_FOLDER'], filename,
+        conditional=True,
+        etag=filename.rsplit('/', 1)[-1] if immutable else True,
+        max_age=current_app.config['MEDIA_MAX_AGE'] if immutable else None
+    )
+    
+    response.accept_ranges = 'bytes'
+    if immutable:
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    return response
 
 
 @main_bp.route('/dashboard')
 @login_required
 def dashboard():
     """Dashboard do utilizador"""
-    # Conteúdos do utilizador
-    user_contents = Content.query.filter_by(user_id=current_user.id)\
-        .order_by(Content.created_at.desc()).all()
+    # Conteúdos do utilizador, por páginas (?cursor=), só com as colunas dos cartões
+    query = Content.query.filter_by(user_id=current_user.id).options(load_only(*LIST_COLUMNS))
+    user_contents, next_cursor = paginate(query, request.args.get('cursor'), per_page=24)
+    
+    # Estatísticas de todos os conteúdos (não só da página atual)
+    category_counts = dict(
+        db.session.query(Content.category, func.count(Content.id))
+        .filter(Content.user_id == current_user.id)
+        .group_by(Content.category)
+        .all()
+    )
     
-    return render_template('dashboard.html', contents=user_contents)
+    return render_template('dashboard.html', contents=user_contents, next_cursor=next_cursor,
+                           category_counts=category_counts, total_contents=sum(category_counts.values()))
 
 
 @main_bp.route('/content/new', methods=['GET', 'POST'])
@@ -62,11 +136,22 @@ def new_content():
             flash('Título, descrição e categoria são obrigatórios.', 'error')
             return render_template('content_form.html')
         
+        coordinates = parse_coordinates(latitude, longitude)
+        if coordinates is None:
+            flash('Coordenadas inválidas.', 'error')
+            return render_template('content_form.html')
+        
         # Upload de ficheiro
         media_filename = None
         media_type = None
         
-        if 'media_file' in request.files:
+        upload_id = request.form.get('upload_id')
+        if upload_id:
+            # Ficheiro já enviado por blocos através de /api/uploads
+            media_filename = claim_upload(upload_id, current_user.id)
+            if media_filename:
+                media_type = get_media_type(media_filename)
+        elif 'media_file' in request.files:
             file = request.files['media_file']
             if file and file.filename:
                 media_filename = save_uploaded_file(file)
@@ -80,9 +165,7 @@ def new_content():
             flash('É obrigatório carregar um ficheiro multimédia.', 'error')
             return render_template('content_form.html')
         
-        # Converter coordenadas
-        lat = float(latitude) if latitude else None
-        lon = float(longitude) if longitude else None
+        lat, lon = coordinates
         
         # Criar conteúdo
         content = Content(
@@ -97,8 +180,19 @@ def new_content():
             user_id=current_user.id
         )
         
+        # A referência ao ficheiro já foi registada ao guardá-lo (ou no finalize do upload por blocos)
         db.session.add(content)
+        
+        # Miniaturas, posters e duração são calculados pelo worker.py
+        job = enqueue_media_job(content)
+        
+        version = bump_content_version()
+        touch_tiles(version, (content.latitude, content.longitude))
         db.session.commit()
+        cluster_index.update(version, added=(content.latitude, content.longitude, content.category))
+        
+        if job and current_app.config['MEDIA_PROCESSING_INLINE']:
+            process_inline(job)
         
         flash('Conteúdo criado com sucesso!', 'success')
         return redirect(url_for('main.dashboard'))
@@ -118,33 +212,59 @@ def edit_content(id):
         return redirect(url_for('main.dashboard'))
     
     if request.method == 'POST':
+        # Posição e categoria anteriores (para atualizar os clusters)
+        previous = (content.latitude, content.longitude, content.category)
+        job = None
+        
         content.title = request.form.get('title', '').strip()
         content.description = request.form.get('description', '').strip()
         content.category = request.form.get('category', '').strip()
         content.location_name = request.form.get('location_name', '').strip()
         
-        latitude = request.form.get('latitude')
-        longitude = request.form.get('longitude')
-        content.latitude = float(latitude) if latitude else None
-        content.longitude = float(longitude) if longitude else None
+        coordinates = parse_coordinates(request.form.get('latitude'), request.form.get('longitude'))
+        if coordinates is None:
+            flash('Coordenadas inválidas.', 'error')
+            return render_template('content_form.html', content=content)
+        content.latitude, content.longitude = coordinates
         
         # Upload de novo ficheiro (opcional)
-        if 'media_file' in request.files:
+        previous_media = None
+        media_filename = None
+        upload_id = request.form.get('upload_id')
+        if upload_id:
+            # Ficheiro já enviado por blocos através de /api/uploads
+            media_filename = claim_upload(upload_id, current_user.id)
+        elif 'media_file' in request.files:
             file = request.files['media_file']
             if file and file.filename:
-                # Remover ficheiro antigo
-                if content.media_filename:
-                    old_file = os.path.join('static/uploads', content.media_filename)
-                    if os.path.exists(old_file):
-                        os.remove(old_file)
-                
                 # Guardar novo ficheiro
                 media_filename = save_uploaded_file(file)
-                if media_filename:
-                    content.media_filename = media_filename
-                    content.media_type = get_media_type(media_filename)
         
+        if media_filename:
+            # O ficheiro antigo só é removido se mais nenhum conteúdo o usar
+            # (a referência ao novo foi registada ao guardá-lo ou no finalize)
+            previous_media = (content.media_filename, content.media_variants)
+            release_blob(content.media_filename)
+            
+            content.media_filename = media_filename
+            content.media_type = get_media_type(media_filename)
+            content.media_variants = None
+            content.media_poster = None
+            content.media_duration = None
+            job = enqueue_media_job(content)
+        
+        version = bump_content_version()
+        touch_tiles(version, previous[:2], (content.latitude, content.longitude))
         db.session.commit()
+        cluster_index.update(version, removed=previous,
+                             added=(content.latitude, content.longitude, content.category))
+        
+        if previous_media and previous_media[0] != content.media_filename:
+            delete_unused_media(*previous_media)
+        
+        if job and current_app.config['MEDIA_PROCESSING_INLINE']:
+            process_inline(job)
+        
         flash('Conteúdo atualizado com sucesso!', 'success')
         return redirect(url_for('main.dashboard'))
     
@@ -162,38 +282,185 @@ def delete_content(id):
         flash('Não tens permissão para eliminar este conteúdo.', 'error')
         return redirect(url_for('main.dashboard'))
     
-    # Remover ficheiro
-    if content.media_filename:
-        file_path = os.path.join('static/uploads', content.media_filename)
-        if os.path.exists(file_path):
-            os.remove(file_path)
+    previous = (content.latitude, content.longitude, content.category)
+    media = (content.media_filename, content.media_variants)
     
     db.session.delete(content)
+    release_blob(content.media_filename)
+    version = bump_content_version()
+    touch_tiles(version, previous[:2])
     db.session.commit()
+    cluster_index.update(version, removed=previous)
+    
+    # Remover ficheiro (e derivados) se mais nenhum conteúdo o usar
+    delete_unused_media(*media)
     
     flash('Conteúdo eliminado com sucesso!', 'success')
     return redirect(url_for('main.dashboard'))
 
 
-@main_bp.route('/api/contents')
-def api_contents():
-    """API para obter todos os conteúdos (para o mapa)"""
-    contents = Content.query.filter(
+def visible_contents_query(bbox=None, category=None):
+    """Query dos conteúdos com coordenadas, opcionalmente filtrados por área e categoria"""
+    query = Content.query.filter(
         Content.latitude.isnot(None),
         Content.longitude.isnot(None)
-    ).all()
+    )
+    
+    if bbox:
+        query = filter_bbox(query, bbox)
+    
+    if category:
+        query = query.filter(Content.category == category)
+    
+    return query
+
+
+def read_map_args():
+    """Ler os parâmetros bbox e category do pedido (bbox inválida -> False)"""
+    bbox = None
+    bbox_param = request.args.get('bbox')
+    if bbox_param:
+        bbox = parse_bbox(bbox_param) or False
+    
+    category = request.args.get('category', '').strip()
+    if category == 'all':
+        category = ''
+    
+    return bbox, category
+
+
+@main_bp.route('/api/contents')
+def api_contents():
+    """API para obter os conteúdos (para o mapa), opcionalmente só os visíveis"""
+    # Filtrar pela área visível do mapa (bbox=minLon,minLat,maxLon,maxLat)
+    bbox, category = read_map_args()
+    if bbox is False:
+        return jsonify({'error': 'bbox inválida'}), 400
+    
+    zoom = request.args.get('z', type=int)
+    
+    # Paginação por cursor (?limit=&cursor=), do mais recente para o mais antigo
+    if 'cursor' in request.args or 'limit' in request.args:
+        cursor = request.args.get('cursor')
+        if cursor and decode_cursor(cursor) is None:
+            return jsonify({'error': 'Cursor inválido'}), 400
+        limit = min(max(request.args.get('limit', 100, type=int), 1), 500)
+        items, next_cursor = paginate_map(visible_contents_query(bbox, category), cursor, limit)
+        return json_response({'items': items, 'next_cursor': next_cursor})
+    
+    # Sem filtros: servir o snapshot em cache (304 se o cliente já o tiver)
+    if not bbox and not category and zoom is None:
+        snapshot = snapshot_cache.get('contents', lambda: dumps(map_contents(visible_contents_query())))
+        return snapshot_response(snapshot)
+    
+    contents = map_contents(visible_contents_query(bbox, category))
+    return json_response(thin_by_zoom(contents, zoom))
+
+
+@main_bp.route('/api/contents.geojson')
+def api_contents_geojson():
+    """API com todos os conteúdos em GeoJSON (snapshot versionado com ETag)"""
+    snapshot = snapshot_cache.get(
+        'geojson',
+        lambda: dumps(to_geojson(map_contents(visible_contents_query()))),
+        mimetype='application/geo+json'
+    )
+    return snapshot_response(snapshot)
+
+
+@main_bp.route('/api/contents/clusters')
+def api_contents_clusters():
+    """API de clusters do mapa (pontos individuais acima de CLUSTER_MAX_ZOOM)"""
+    bbox, category = read_map_args()
+    if bbox is False:
+        return jsonify({'error': 'bbox inválida'}), 400
+    
+    zoom = request.args.get('z', type=int)
+    if zoom is None:
+        return jsonify({'error': 'Parâmetro z obrigatório'}), 400
+    
+    if zoom > CLUSTER_MAX_ZOOM:
+        # Pontos individuais só dentro da área visível e em número limitado
+        if not bbox:
+            return jsonify({'error': f'Parâmetro bbox obrigatório acima do zoom {CLUSTER_MAX_ZOOM}'}), 400
+        query = visible_contents_query(bbox, category).order_by(Content.created_at.desc())
+        return json_response({
+            'zoom': zoom,
+            'clusters': [],
+            'points': thin_by_zoom(map_contents(query, CLUSTER_MAX_POINTS), zoom)
+        })
+    
+    return json_response({
+        'zoom': zoom,
+        'clusters': cluster_index.clusters(zoom, bbox, category),
+        'points': []
+    })
+
+
+@main_bp.route('/api/contents/nearby')
+def api_contents_nearby():
+    """Os k conteúdos mais próximos de um ponto, com a distância em metros"""
+    lat = request.args.get('lat', type=float)
+    lon = request.args.get('lon', type=float)
+    if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({'error': 'Coordenadas inválidas'}), 400
+    
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+    radius_m = request.args.get('radius_m', type=float)
+    if radius_m is not None and (not math.isfinite(radius_m) or radius_m <= 0):
+        return jsonify({'error': 'Raio inválido'}), 400
+    
+    _, category = read_map_args()
+    exclude_id = request.args.get('exclude', type=int)
+    
+    nearest = nearest_contents(lat, lon, k, radius_m, category, exclude_id)
+    if not nearest:
+        return json_response([])
+    
+    # Obter os conteúdos numa só query e repor a ordem por distância
+    distances = dict(nearest)
+    items = map_contents(Content.query.filter(Content.id.in_(distances)))
+    for item in items:
+        item['distance_m'] = round(distances[item['id']], 1)
+    items.sort(key=lambda item: distances[item['id']])
+    
+    return json_response(items)
+
+
+@main_bp.route('/api/contents/search')
+def api_contents_search():
+    """Pesquisa de texto nos conteúdos (FTS5, BM25, prefixo), opcionalmente numa área"""
+    q = request.args.get('q', '').strip()
+    if not q:
+        return jsonify({'error': 'Query vazia'}), 400
+    
+    bbox, category = read_map_args()
+    if bbox is False:
+        return jsonify({'error': 'bbox inválida'}), 400
+    
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    
+    query = search_contents_query(q)
+    if query is None:
+        return json_response([])
+    
+    if bbox:
+        query = filter_bbox(query, bbox)
+    if category:
+        query = query.filter(Content.category == category)
     
-    return jsonify([content.to_dict() for content in contents])
+    return json_response(map_contents(query, limit))
 
 
 @main_bp.route('/api/search-location')
 def api_search_location():
-    """API para pesquisar localização via Nominatim"""
-    query = request.args.get('q', '')
+    """API para pesquisar localização (gazetteer local, depois geocoder externo em cache)"""
+    query = request.args.get('q', '').strip()
     
     if not query:
         return jsonify({'error': 'Query vazia'}), 400
     
-    # Esta rota será usada pelo frontend para chamar a API Nominatim
-    # O frontend faz a chamada diretamente ao Nominatim
-    return jsonify({'message': 'Use o frontend para pesquisar'})
+    limit = min(max(request.args.get('limit', 5, type=int), 1), 20)
+    # Sugestões enquanto se escreve (?upstream=0) não vão ao geocoder externo
+    upstream = request.args.get('upstream', '1') != '0'
+    return json_response(geocoder.search(query, limit, upstream))
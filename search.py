@@ -0,0 +1,104 @@
+import re
+from sqlalchemy import text, table, column
+from models import db, Content
+
+# Índice FTS5 (external content) sobre a tabela contents
+FTS_TABLE = 'contents_fts'
+FTS_COLUMNS = ('title', 'description', 'location_name', 'category')
+
+# Pesos BM25 por coluna (pela ordem de FTS_COLUMNS)
+FTS_WEIGHTS = (10.0, 1.0, 5.0, 2.0)
+
+contents_fts = table(FTS_TABLE, column('rowid'))
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_index_available():
+    """Verificar se a base de dados suporta o índice FTS5"""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def init_search_index():
+    """Criar o índice FTS5 e os triggers que o mantêm sincronizado"""
+    if not search_index_available():
+        return
+
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+
+    with db.engine.begin() as conn:
+        tables = {row[0] for row in conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        ))}
+        if 'contents' not in tables:
+            return
+
+        # remove_diacritics: "Belém" e "belem" dão o mesmo token
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+            f"{columns}, content='contents', content_rowid='id', "
+            "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+        ))
+
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON contents BEGIN "
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); "
+            "END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON contents BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+            "END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON contents BEGIN "
+            f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', old.id, {old_values}); "
+            f"INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values}); "
+            "END"
+        ))
+
+        # Indexar conteúdos criados antes de existir o índice
+        if FTS_TABLE not in tables:
+            conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def build_match_query(query, prefix=True):
+    """Converter o texto do utilizador numa expressão MATCH segura
+
+    Cada palavra é citada (sem operadores FTS5) e, em modo prefixo, a última
+    aceita qualquer terminação ("torre bel" encontra "Torre de Belém").
+    """
+    tokens = TOKEN_RE.findall(query)
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    if prefix:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_contents_query(query, prefix=True):
+    """Query de Content ordenada por relevância (BM25); None se não houver termos"""
+    match = build_match_query(query, prefix)
+    if match is None:
+        return None
+
+    if not search_index_available():
+        # Sem FTS5: procurar todas as palavras no título/descrição/local
+        result = Content.query
+        for token in TOKEN_RE.findall(query):
+            pattern = f'%{token}%'
+            result = result.filter(
+                Content.title.ilike(pattern) | Content.description.ilike(pattern)
+                | Content.location_name.ilike(pattern) | Content.category.ilike(pattern)
+            )
+        return result.order_by(Content.created_at.desc())
+
+    weights = ', '.join(str(w) for w in FTS_WEIGHTS)
+    return Content.query\
+        .join(contents_fts, contents_fts.c.rowid == Content.id)\
+        .filter(text(f'{FTS_TABLE} MATCH :match'))\
+        .params(match=match)\
+        .order_by(text(f'bm25({FTS_TABLE}, {weights})'))
@@ -0,0 +1,82 @@
+import json
+from flask import Response
+from models import Content, User
+
+try:
+    import orjson
+except ImportError:  # orjson é opcional
+    orjson = None
+
+# Colunas necessárias ao mapa (sem hidratar objetos Content nem carregar o autor à parte)
+MAP_COLUMNS = (
+    Content.id,
+    Content.title,
+    Content.description,
+    Content.category,
+    Content.media_type,
+    Content.media_filename,
+    Content.latitude,
+    Content.longitude,
+    Content.location_name,
+    Content.media_variants,
+    Content.media_poster,
+    Content.media_duration,
+    Content.created_at,
+)
+
+MAP_KEYS = tuple(column.key for column in MAP_COLUMNS) + ('author',)
+
+
+def dumps(data):
+    """Serializar para JSON (bytes), com orjson quando disponível"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def json_response(data, status=200):
+    """Resposta JSON serializada com dumps()"""
+    return Response(dumps(data), status=status, mimetype='application/json')
+
+
+def map_rows(query=None, limit=None):
+    """Linhas (colunas do mapa + username do autor) numa única query com JOIN"""
+    if query is None:
+        query = Content.query
+    query = query.with_entities(*MAP_COLUMNS, User.username)\
+        .join(User, User.id == Content.user_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return query.all()
+
+
+def serialize_map_rows(rows):
+    """Converter linhas de map_rows() em dicionários iguais a Content.to_dict()"""
+    result = []
+    for row in rows:
+        item = dict(zip(MAP_KEYS, row))
+        if item['created_at'] is not None:
+            item['created_at'] = item['created_at'].isoformat()
+        result.append(item)
+    return result
+
+
+def map_contents(query=None, limit=None):
+    """Conteúdos prontos para o mapa, sem N+1 ao autor"""
+    return serialize_map_rows(map_rows(query, limit))
+
+
+def to_geojson(items):
+    """Converter dicionários de map_contents() numa FeatureCollection GeoJSON"""
+    features = []
+    for item in items:
+        properties = dict(item)
+        lon = properties.pop('longitude')
+        lat = properties.pop('latitude')
+        features.append({
+            'type': 'Feature',
+            'id': item['id'],
+            'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+            'properties': properties,
+        })
+    return {'type': 'FeatureCollection', 'features': features}
@@ -0,0 +1,308 @@
+import math
+import threading
+from sqlalchemy import text, table, column
+from models import db, Content
+from cache import get_content_version
+
+# Tabela virtual R*Tree com a caixa envolvente de cada conteúdo
+RTREE_TABLE = 'contents_rtree'
+
+contents_rtree = table(
+    RTREE_TABLE,
+    column('id'),
+    column('min_lon'),
+    column('max_lon'),
+    column('min_lat'),
+    column('max_lat'),
+)
+
+# Tamanho (em píxeis) da célula usada para descartar marcadores sobrepostos
+MARKER_CELL_PX = 16
+
+
+def spatial_index_available():
+    """Verificar se a base de dados suporta o índice R*Tree"""
+    return db.engine.dialect.name == 'sqlite'
+
+
+def init_spatial_index():
+    """Criar o índice R*Tree e os triggers que o mantêm sincronizado"""
+    if not spatial_index_available():
+        return
+
+    with db.engine.begin() as conn:
+        # Só é possível criar os triggers depois de existir a tabela contents
+        exists = conn.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'contents'"
+        )).first()
+        if not exists:
+            return
+
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {RTREE_TABLE} "
+            "USING rtree(id, min_lon, max_lon, min_lat, max_lat)"
+        ))
+
+        # Triggers: criar, editar e eliminar conteúdos atualizam o índice
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ai AFTER INSERT ON contents "
+            "WHEN new.latitude IS NOT NULL AND new.longitude IS NOT NULL BEGIN "
+            f"INSERT INTO {RTREE_TABLE} VALUES "
+            "(new.id, new.longitude, new.longitude, new.latitude, new.latitude); "
+            "END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_au AFTER UPDATE OF latitude, longitude ON contents "
+            "BEGIN "
+            f"DELETE FROM {RTREE_TABLE} WHERE id = old.id; "
+            f"INSERT INTO {RTREE_TABLE} SELECT new.id, new.longitude, new.longitude, new.latitude, new.latitude "
+            "WHERE new.latitude IS NOT NULL AND new.longitude IS NOT NULL; "
+            "END"
+        ))
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {RTREE_TABLE}_ad AFTER DELETE ON contents "
+            f"BEGIN DELETE FROM {RTREE_TABLE} WHERE id = old.id; END"
+        ))
+
+        # Preencher o índice com conteúdos criados antes de existir
+        conn.execute(text(
+            f"INSERT INTO {RTREE_TABLE} "
+            "SELECT id, longitude, longitude, latitude, latitude FROM contents "
+            "WHERE latitude IS NOT NULL AND longitude IS NOT NULL "
+            f"AND id NOT IN (SELECT id FROM {RTREE_TABLE})"
+        ))
+
+
+def parse_bbox(value):
+    """Converter 'minLon,minLat,maxLon,maxLat' num tuplo (ou None se inválido)"""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+
+    if not all(math.isfinite(v) for v in (min_lon, min_lat, max_lon, max_lat)):
+        return None
+    if min_lon > max_lon or min_lat > max_lat:
+        return None
+    # Com pouco zoom (ou sobre o antimeridiano) o Leaflet devolve longitudes fora de ±180
+    if max_lon - min_lon >= 360:
+        min_lon, max_lon = -180.0, 180.0
+    return (max(min_lon, -180.0), max(min_lat, -90.0),
+            min(max_lon, 180.0), min(max_lat, 90.0))
+
+
+def filter_bbox(query, bbox):
+    """Restringir uma query de Content à caixa envolvente indicada"""
+    min_lon, min_lat, max_lon, max_lat = bbox
+
+    if spatial_index_available():
+        # Pesquisa no R*Tree em vez de percorrer a tabela contents
+        return query.join(contents_rtree, contents_rtree.c.id == Content.id).filter(
+            contents_rtree.c.min_lon <= max_lon,
+            contents_rtree.c.max_lon >= min_lon,
+            contents_rtree.c.min_lat <= max_lat,
+            contents_rtree.c.max_lat >= min_lat,
+        )
+
+    return query.filter(
+        Content.longitude.between(min_lon, max_lon),
+        Content.latitude.between(min_lat, max_lat),
+    )
+
+
+# Pesquisa de vizinhos: raio inicial e máximo (em metros) da janela de procura
+NEARBY_START_RADIUS_M = 500
+NEARBY_MAX_RADIUS_M = 50000
+# Número máximo de janelas (o raio duplica de NEARBY_START_RADIUS_M até ao máximo)
+NEARBY_MAX_STEPS = math.ceil(math.log2(NEARBY_MAX_RADIUS_M / NEARBY_START_RADIUS_M)) + 1
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Distância (em metros) entre dois pontos na superfície da Terra"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def radius_bbox(lat, lon, radius_m):
+    """Caixa envolvente (minLon, minLat, maxLon, maxLat) de um círculo"""
+    dlat = radius_m / METERS_PER_DEGREE
+    # Perto dos polos um grau de longitude encolhe até zero
+    dlon = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 1e-6))
+    return (max(lon - dlon, -180.0), max(lat - dlat, -90.0),
+            min(lon + dlon, 180.0), min(lat + dlat, 90.0))
+
+
+def nearest_contents(lat, lon, k, radius_m=None, category=None, exclude_id=None):
+    """Os k conteúdos mais próximos de um ponto: [(id, distância em metros)]
+
+    O R*Tree devolve apenas os candidatos dentro de uma janela à volta do
+    ponto; a janela duplica até haver k resultados ou atingir o raio máximo.
+    """
+    max_radius = min(radius_m or NEARBY_MAX_RADIUS_M, NEARBY_MAX_RADIUS_M)
+    radius = min(NEARBY_START_RADIUS_M, max_radius)
+
+    for step in range(NEARBY_MAX_STEPS):
+        query = db.session.query(Content.id, Content.latitude, Content.longitude).filter(
+            Content.latitude.isnot(None),
+            Content.longitude.isnot(None)
+        )
+        query = filter_bbox(query, radius_bbox(lat, lon, radius))
+        if category:
+            query = query.filter(Content.category == category)
+        if exclude_id is not None:
+            query = query.filter(Content.id != exclude_id)
+
+        # Só os pontos dentro do círculo: os cantos da caixa podem esconder
+        # pontos mais próximos que ainda estão fora da janela
+        found = []
+        for content_id, content_lat, content_lon in query.all():
+            distance = haversine_m(lat, lon, content_lat, content_lon)
+            if distance <= radius:
+                found.append((distance, content_id))
+
+        if len(found) >= k or radius >= max_radius or step == NEARBY_MAX_STEPS - 1:
+            found.sort()
+            return [(content_id, distance) for distance, content_id in found[:k]]
+        radius = min(radius * 2, max_radius)
+
+
+def cell_size_degrees(zoom, cell_px=MARKER_CELL_PX):
+    """Largura (em graus) de uma célula de cell_px píxeis no zoom indicado"""
+    # Um mosaico de 256px cobre 360 / 2^zoom graus de longitude
+    return 360.0 / (2 ** zoom) / 256 * cell_px
+
+
+def thin_by_zoom(items, zoom, max_zoom=17):
+    """Manter apenas um conteúdo por célula de ecrã (marcadores sobrepostos)"""
+    if zoom is None or zoom >= max_zoom:
+        return items
+
+    size = cell_size_degrees(zoom)
+    seen = set()
+    result = []
+    for item in items:
+        cell = (int(item['longitude'] // size), int(item['latitude'] // size))
+        if cell in seen:
+            continue
+        seen.add(cell)
+        result.append(item)
+    return result
+
+
+# Agrupamento de marcadores (clusters) por célula de grelha e nível de zoom
+CLUSTER_CELL_PX = 64
+CLUSTER_MAX_ZOOM = 15  # acima deste zoom a API devolve os pontos individuais
+CLUSTER_MAX_POINTS = 500  # máximo de pontos individuais por pedido (como o limit de /api/contents)
+
+
+class ClusterIndex:
+    """Agregados pré-calculados (contagem e centróide) por célula, zoom e categoria"""
+
+    def __init__(self, max_zoom=CLUSTER_MAX_ZOOM, cell_px=CLUSTER_CELL_PX):
+        self.max_zoom = max_zoom
+        self.cell_px = cell_px
+        self.levels = None  # construído no primeiro pedido
+        self.version = None  # versão dos conteúdos refletida nos agregados
+        self.lock = threading.Lock()
+
+    def _cell(self, zoom, lat, lon):
+        size = cell_size_degrees(zoom, self.cell_px)
+        return int(lon // size), int(lat // size)
+
+    def _apply(self, lat, lon, category, sign):
+        """Somar (sign=1) ou subtrair (sign=-1) um ponto a todos os níveis"""
+        for zoom, cells in enumerate(self.levels):
+            key = self._cell(zoom, lat, lon)
+            per_category = cells.setdefault(key, {})
+            totals = per_category.setdefault(category, [0, 0.0, 0.0])
+            totals[0] += sign
+            totals[1] += sign * lat
+            totals[2] += sign * lon
+            if totals[0] <= 0:
+                del per_category[category]
+                if not per_category:
+                    del cells[key]
+
+    def build(self, version):
+        """Calcular os agregados a partir da base de dados"""
+        levels = [{} for _ in range(self.max_zoom + 1)]
+        rows = db.session.query(Content.latitude, Content.longitude, Content.category).filter(
+            Content.latitude.isnot(None),
+            Content.longitude.isnot(None)
+        ).all()
+        with self.lock:
+            self.levels = levels
+            self.version = version
+            for lat, lon, category in rows:
+                self._apply(lat, lon, category, 1)
+
+    def reset(self):
+        """Descartar os agregados (voltam a ser calculados no próximo pedido)"""
+        with self.lock:
+            self.levels = None
+            self.version = None
+
+    def update(self, version, removed=None, added=None):
+        """Aplicar uma escrita já confirmada (tuplos lat, lon, categoria)
+
+        Se entretanto outro processo alterou conteúdos (a versão saltou),
+        os agregados são descartados e reconstruídos no próximo pedido.
+        """
+        with self.lock:
+            if self.levels is None:
+                return
+            if self.version != version - 1:
+                self.levels = None
+                self.version = None
+                return
+            if removed and removed[0] is not None and removed[1] is not None:
+                self._apply(*removed, -1)
+            if added and added[0] is not None and added[1] is not None:
+                self._apply(*added, 1)
+            self.version = version
+
+    def clusters(self, zoom, bbox=None, category=None):
+        """Obter os clusters visíveis no zoom e na área indicados"""
+        version, _ = get_content_version()
+        if self.levels is None or self.version != version:
+            self.build(version)
+
+        zoom = max(0, min(zoom, self.max_zoom))
+        cells = (self.levels or [{}] * (self.max_zoom + 1))[zoom]
+
+        with self.lock:
+            if bbox:
+                min_lon, min_lat, max_lon, max_lat = bbox
+                x0, y0 = self._cell(zoom, min_lat, min_lon)
+                x1, y1 = self._cell(zoom, max_lat, max_lon)
+                # Percorrer a janela de células ou o dicionário, o que for menor
+                if (x1 - x0 + 1) * (y1 - y0 + 1) < len(cells):
+                    keys = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in cells]
+                else:
+                    keys = [k for k in cells if x0 <= k[0] <= x1 and y0 <= k[1] <= y1]
+            else:
+                keys = list(cells)
+
+            result = []
+            for key in keys:
+                per_category = cells[key]
+                if category:
+                    per_category = {category: per_category[category]} if category in per_category else {}
+                count = sum(t[0] for t in per_category.values())
+                if not count:
+                    continue
+                result.append({
+                    'latitude': sum(t[1] for t in per_category.values()) / count,
+                    'longitude': sum(t[2] for t in per_category.values()) / count,
+                    'count': count,
+                    'categories': {cat: t[0] for cat, t in per_category.items()},
+                })
+        return result
+
+
+cluster_index = ClusterIndex()
@@ -14,11 +14,7 @@ function quickSearch() {
 // Pesquisa rápida de localização
 async function searchLocationQuick(query) {
   try {
-    const searchQuery = query.includes("Lisboa") ? query : `${query}, Lisboa, Portugal`
-
-    const response = await fetch(
-      `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(searchQuery)}&limit=1`,
-    )
+    const response = await fetch(`/api/search-location?q=${encodeURIComponent(query)}&limit=1`)
 
     const results = await response.json()
 
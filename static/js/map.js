@@ -3,6 +3,8 @@ let mainMap
 let markers = []
 let allContents = []
 let searchMarker = null
+let currentCategory = "all"
+let loadController = null
 
 // Importar a biblioteca Leaflet
 const L = window.L
@@ -32,7 +34,7 @@ function getCustomIcon(category) {
 }
 
 // Inicializar mapa principal
-function initMainMap(contents) {
+function initMainMap() {
   // Criar mapa centrado em Lisboa
   mainMap = L.map("mainMap").setView([38.7223, -9.1393], 13)
 
@@ -42,16 +44,42 @@ function initMainMap(contents) {
     maxZoom: 19,
   }).addTo(mainMap)
 
-  // Guardar conteúdos
-  allContents = contents
+  // Carregar apenas os conteúdos da área visível sempre que o mapa se move
+  mainMap.on("moveend", loadVisibleContents)
+  loadVisibleContents()
+}
 
-  // Adicionar marcadores
-  addMarkersToMap(contents)
+// Obter da API os conteúdos dentro da área visível do mapa
+async function loadVisibleContents() {
+  // Trazer a área visível para a cópia principal do mundo (o servidor limita a ±180)
+  const bounds = mainMap.wrapLatLngBounds(mainMap.getBounds())
+  const params = new URLSearchParams({
+    bbox: [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()].join(","),
+    z: mainMap.getZoom(),
+    category: currentCategory,
+  })
 
-  // Ajustar zoom para mostrar todos os marcadores
-  if (markers.length > 0) {
-    const group = L.featureGroup(markers)
-    mainMap.fitBounds(group.getBounds().pad(0.1))
+  // Cancelar o pedido anterior se o mapa voltar a mexer antes da resposta
+  if (loadController) {
+    loadController.abort()
+  }
+  loadController = new AbortController()
+
+  try {
+    // Com pouco zoom o servidor devolve clusters em vez de pontos individuais
+    const response = await fetch(`/api/contents/clusters?${params.toString()}`, { signal: loadController.signal })
+    if (!response.ok) {
+      console.error("Erro ao carregar conteúdos:", response.status)
+      return
+    }
+    const data = await response.json()
+    allContents = data.points
+    addMarkersToMap(allContents)
+    addClustersToMap(data.clusters)
+  } catch (error) {
+    if (error.name !== "AbortError") {
+      console.error("Erro ao carregar conteúdos:", error)
+    }
   }
 }
 
@@ -71,6 +99,7 @@ function addMarkersToMap(contents) {
       // Popup com informação
       const popupContent = createPopupContent(content)
       marker.bindPopup(popupContent, { maxWidth: 300 })
+      marker.on("popupopen", (e) => loadNearby(content, e.popup))
 
       // Guardar referência
       marker.contentData = content
@@ -79,17 +108,53 @@ function addMarkersToMap(contents) {
   })
 }
 
+// Adicionar clusters (contagem por célula) ao mapa
+function addClustersToMap(clusters) {
+  clusters.forEach((cluster) => {
+    // Cor da categoria predominante no cluster
+    const mainCategory = Object.keys(cluster.categories).reduce((a, b) =>
+      cluster.categories[a] >= cluster.categories[b] ? a : b,
+    )
+    const color = categoryColors[mainCategory] || "#2ecc71"
+    const size = cluster.count < 10 ? 30 : cluster.count < 100 ? 40 : 50
+
+    const marker = L.marker([cluster.latitude, cluster.longitude], {
+      icon: L.divIcon({
+        className: "cluster-marker",
+        html: `<div style="background-color: ${color}; width: ${size}px; height: ${size}px; line-height: ${size}px;">${cluster.count}</div>`,
+        iconSize: [size, size],
+        iconAnchor: [size / 2, size / 2],
+      }),
+    }).addTo(mainMap)
+
+    // Clicar no cluster aproxima o mapa
+    marker.on("click", () => {
+      mainMap.setView([cluster.latitude, cluster.longitude], mainMap.getZoom() + 2)
+    })
+
+    markers.push(marker)
+  })
+}
+
 // Criar conteúdo do popup
 function createPopupContent(content) {
   let mediaHtml = ""
 
   if (content.media_filename) {
-    const mediaUrl = `/static/uploads/${content.media_filename}`
-
-    if (content.media_type === "image") {
+    const mediaUrl = `/media/${content.media_filename}`
+
+    if (content.media_type === "image" && content.media_variants) {
+      // Miniatura mais pequena (popup com 280px), em WebP quando suportado
+      const variant = content.media_variants[0]
+      mediaHtml = `<picture>
+                <source type="image/webp" srcset="/media/${variant.webp}">
+                <img src="/media/${variant.src}" alt="${content.title}" class="popup-image">
+            </picture>`
+    } else if (content.media_type === "image") {
       mediaHtml = `<img src="${mediaUrl}" alt="${content.title}" class="popup-image">`
     } else if (content.media_type === "video") {
-      mediaHtml = `<video class="popup-video" controls><source src="${mediaUrl}"></video>`
+      const poster = content.media_poster ? `poster="/media/${content.media_poster}"` : ""
+      mediaHtml = `<video class="popup-video" controls preload="none" ${poster}><source src="${mediaUrl}"></video>`
     } else if (content.media_type === "audio") {
       mediaHtml = `<audio class="popup-audio" controls><source src="${mediaUrl}"></audio>`
     }
@@ -105,10 +170,56 @@ function createPopupContent(content) {
             <p class="popup-description">${content.description}</p>
             ${content.location_name ? `<p class="popup-location">📍 ${content.location_name}</p>` : ""}
             <p class="popup-author">Por: ${content.author}</p>
+            <div class="popup-nearby"></div>
         </div>
     `
 }
 
+// Formatar uma distância em metros (ex.: "350 m", "1,2 km")
+function formatDistance(meters) {
+  if (meters < 1000) {
+    return `${Math.round(meters)} m`
+  }
+  return `${(meters / 1000).toFixed(1).replace(".", ",")} km`
+}
+
+// Mostrar no popup os conteúdos mais próximos (/api/contents/nearby)
+async function loadNearby(content, popup) {
+  const container = popup.getElement()?.querySelector(".popup-nearby")
+  if (!container || container.dataset.loaded) {
+    return
+  }
+  container.dataset.loaded = "1"
+
+  const params = new URLSearchParams({
+    lat: content.latitude,
+    lon: content.longitude,
+    k: 4,
+    radius_m: 2000,
+    exclude: content.id,
+  })
+
+  try {
+    const response = await fetch(`/api/contents/nearby?${params.toString()}`)
+    const nearby = await response.json()
+    if (!response.ok || nearby.length === 0) {
+      return
+    }
+
+    container.innerHTML = `<h4>Perto daqui</h4><ul></ul>`
+    const list = container.querySelector("ul")
+    nearby.forEach((item) => {
+      const li = document.createElement("li")
+      li.textContent = `${item.title} · ${formatDistance(item.distance_m)}`
+      li.onclick = () => mainMap.setView([item.latitude, item.longitude], Math.max(mainMap.getZoom(), 17))
+      list.appendChild(li)
+    })
+    popup.update()
+  } catch (error) {
+    console.error("Erro ao carregar conteúdos próximos:", error)
+  }
+}
+
 // Filtrar conteúdos por categoria
 function filterContents(category) {
   // Atualizar botões ativos
@@ -117,25 +228,12 @@ function filterContents(category) {
   })
   event.target.classList.add("active")
 
-  // Filtrar conteúdos
-  let filteredContents
-  if (category === "all") {
-    filteredContents = allContents
-  } else {
-    filteredContents = allContents.filter((c) => c.category === category)
-  }
-
-  // Atualizar marcadores
-  addMarkersToMap(filteredContents)
-
-  // Ajustar zoom
-  if (markers.length > 0) {
-    const group = L.featureGroup(markers)
-    mainMap.fitBounds(group.getBounds().pad(0.1))
-  }
+  // Filtrar conteúdos no servidor para a área visível
+  currentCategory = category
+  loadVisibleContents()
 }
 
-// Pesquisar local no mapa usando Nominatim
+// Pesquisar local no mapa usando o geocoder do servidor
 async function searchOnMap() {
   const query = document.getElementById("mapSearchInput").value.trim()
 
@@ -145,12 +243,7 @@ async function searchOnMap() {
   }
 
   try {
-    // Adicionar "Lisboa" à pesquisa para resultados mais relevantes
-    const searchQuery = query.includes("Lisboa") ? query : `${query}, Lisboa`
-
-    const response = await fetch(
-      `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(searchQuery)}&limit=1`,
-    )
+    const response = await fetch(`/api/search-location?q=${encodeURIComponent(query)}&limit=1`)
 
     const data = await response.json()
 
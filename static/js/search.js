@@ -1,23 +1,24 @@
-// Pesquisar localização usando Nominatim API
+// Pesquisar localização usando o geocoder do servidor (/api/search-location)
 let miniMap // Declare miniMap variable
 let marker // Declare marker variable
 let L // Declare L variable
+let searchTimeout // pesquisa pendente enquanto se escreve
+const MIN_AUTOCOMPLETE_LENGTH = 3
 
-async function searchLocation() {
+// silent: sugestão enquanto se escreve (sem alertas e só no gazetteer local)
+async function searchLocation(silent = false) {
   const query = document.getElementById("location_search").value.trim()
 
   if (!query) {
-    alert("Por favor, insere um termo de pesquisa.")
+    if (!silent) {
+      alert("Por favor, insere um termo de pesquisa.")
+    }
     return
   }
 
   try {
-    // Adicionar "Lisboa" para resultados mais relevantes
-    const searchQuery = query.includes("Lisboa") ? query : `${query}, Lisboa, Portugal`
-
-    const response = await fetch(
-      `https://nominatim.openstreetmap.org/search?format=json&q=${encodeURIComponent(searchQuery)}&limit=5`,
-    )
+    const upstream = silent ? "&upstream=0" : ""
+    const response = await fetch(`/api/search-location?q=${encodeURIComponent(query)}&limit=5${upstream}`)
 
     const results = await response.json()
 
@@ -43,10 +44,34 @@ async function searchLocation() {
     })
   } catch (error) {
     console.error("Erro na pesquisa:", error)
-    alert("Erro ao pesquisar localização. Tenta novamente.")
+    if (!silent) {
+      alert("Erro ao pesquisar localização. Tenta novamente.")
+    }
   }
 }
 
+// Sugestões enquanto se escreve (com atraso, para não pesquisar a cada tecla)
+if (document.getElementById("location_search")) {
+  const searchInput = document.getElementById("location_search")
+
+  searchInput.addEventListener("input", () => {
+    clearTimeout(searchTimeout)
+    if (searchInput.value.trim().length < MIN_AUTOCOMPLETE_LENGTH) {
+      return
+    }
+    searchTimeout = setTimeout(() => searchLocation(true), 300)
+  })
+
+  // Enter pesquisa de imediato em vez de enviar o formulário
+  searchInput.addEventListener("keydown", (e) => {
+    if (e.key === "Enter") {
+      e.preventDefault()
+      clearTimeout(searchTimeout)
+      searchLocation()
+    }
+  })
+}
+
 // Selecionar localização dos resultados
 function selectLocation(result) {
   const lat = Number.parseFloat(result.lat)
@@ -0,0 +1,118 @@
+// Upload por blocos (retomável) do ficheiro multimédia do formulário
+const MAX_HASH_SIZE = 100 * 1024 * 1024 // acima disto o checksum fica só no servidor
+const MAX_RETRIES = 5
+
+// Calcular o SHA-256 do ficheiro (hexadecimal)
+async function sha256Hex(file) {
+  const buffer = await file.arrayBuffer()
+  const hash = await crypto.subtle.digest("SHA-256", buffer)
+  return Array.from(new Uint8Array(hash))
+    .map((b) => b.toString(16).padStart(2, "0"))
+    .join("")
+}
+
+// Esperar antes de tentar de novo (1s, 2s, 4s, ...)
+function wait(attempt) {
+  return new Promise((resolve) => setTimeout(resolve, 1000 * 2 ** attempt))
+}
+
+// Enviar o ficheiro em blocos e devolver o id do upload finalizado
+async function chunkedUpload(file, onProgress) {
+  const sha256 = file.size <= MAX_HASH_SIZE && window.crypto?.subtle ? await sha256Hex(file) : null
+
+  const initResponse = await fetch("/api/uploads", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ filename: file.name, size: file.size, sha256: sha256 }),
+  })
+  const upload = await initResponse.json()
+  if (!initResponse.ok) {
+    throw new Error(upload.error || "Erro ao iniciar o upload")
+  }
+
+  let offset = 0
+  let attempt = 0
+
+  while (offset < file.size) {
+    const chunk = file.slice(offset, offset + upload.chunk_size)
+
+    try {
+      const response = await fetch(`/api/uploads/${upload.id}?offset=${offset}`, {
+        method: "PUT",
+        headers: { "Content-Type": "application/octet-stream" },
+        body: chunk,
+      })
+      const data = await response.json()
+
+      if (response.ok || response.status === 409) {
+        // 409: o servidor indica onde continuar
+        offset = data.offset
+        attempt = 0
+        onProgress(offset / file.size)
+        continue
+      }
+      throw new Error(data.error || "Erro no envio")
+    } catch (error) {
+      // Falha de rede: perguntar ao servidor onde retomar e tentar de novo
+      if (attempt >= MAX_RETRIES) {
+        throw error
+      }
+      await wait(attempt++)
+      try {
+        const status = await fetch(`/api/uploads/${upload.id}`)
+        offset = (await status.json()).offset
+      } catch (statusError) {
+        console.error("Erro ao obter o estado do upload:", statusError)
+      }
+    }
+  }
+
+  const finalizeResponse = await fetch(`/api/uploads/${upload.id}/finalize`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ sha256: sha256 }),
+  })
+  const result = await finalizeResponse.json()
+  if (!finalizeResponse.ok) {
+    throw new Error(result.error || "Erro ao finalizar o upload")
+  }
+  return result.id
+}
+
+// Intercetar o envio do formulário para enviar o ficheiro por blocos
+if (document.getElementById("contentForm")) {
+  const form = document.getElementById("contentForm")
+
+  form.addEventListener("submit", async (e) => {
+    const fileInput = document.getElementById("media_file")
+    const file = fileInput.files[0]
+
+    if (!file || form.dataset.uploaded) {
+      return
+    }
+
+    e.preventDefault()
+    const progress = document.getElementById("uploadProgress")
+    const submitButton = form.querySelector(".btn-submit")
+    submitButton.disabled = true
+
+    try {
+      const uploadId = await chunkedUpload(file, (fraction) => {
+        progress.textContent = `A enviar ficheiro... ${Math.round(fraction * 100)}%`
+      })
+
+      // Enviar o formulário só com a referência ao upload
+      document.getElementById("upload_id").value = uploadId
+      fileInput.removeAttribute("name")
+      fileInput.required = false
+      form.dataset.uploaded = "1"
+      progress.textContent = "Ficheiro enviado."
+      form.submit()
+    } catch (error) {
+      console.error("Erro no upload:", error)
+      progress.textContent = ""
+      submitButton.disabled = false
+      alert("Erro ao enviar o ficheiro. Tenta novamente.")
+    }
+  })
+}
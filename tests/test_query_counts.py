@@ -0,0 +1,77 @@
+"""Número de queries SQL por pedido: constante, qualquer que seja o número de conteúdos
+
+Uso: python -m pytest tests
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import event
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+# Base de dados e ficheiros gerados numa pasta temporária (antes de importar a aplicação)
+WORKDIR = tempfile.mkdtemp(prefix='discover-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(WORKDIR, 'test.db')}"
+os.environ['ASSETS_BUILD'] = 'false'
+os.environ['MAIL_SENDER_THREAD'] = 'false'
+os.environ['GEOCODER_UPSTREAM'] = 'none'
+
+from app import app, db  # noqa: E402
+from models import Content, User  # noqa: E402
+from cache import snapshot_cache  # noqa: E402
+from page_cache import page_cache  # noqa: E402
+from seed import seed_database  # noqa: E402
+
+PATHS = ['/', '/map', '/api/contents']
+
+
+@pytest.fixture(scope='module')
+def client():
+    app.config.update(
+        TESTING=True,
+        UPLOAD_FOLDER=os.path.join(WORKDIR, 'uploads'),
+        CHUNKED_UPLOAD_FOLDER=os.path.join(WORKDIR, 'partial_uploads'),
+        MAIL_OUTBOX_FOLDER=os.path.join(WORKDIR, 'outbox'),
+        USER_CACHE_VERSION_FILE=os.path.join(WORKDIR, 'users.version'),
+        TILE_CACHE_FOLDER=os.path.join(WORKDIR, 'tiles'),
+    )
+    return app.test_client()
+
+
+def count_queries(client, path):
+    """Queries executadas num pedido, sem caches (página, fragmentos e snapshots)"""
+    page_cache.clear()
+    snapshot_cache.clear()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+    assert response.status_code == 200, path
+    return len(statements)
+
+
+def test_queries_do_not_grow_with_contents(client):
+    with app.app_context():
+        seed_database(db, Content, User, 5, 2)
+    for path in PATHS:
+        count_queries(client, path)  # primeiro pedido: caches do processo (utilizadores, versões)
+    few = {path: count_queries(client, path) for path in PATHS}
+
+    with app.app_context():
+        seed_database(db, Content, User, 50, 2)
+        assert db.session.query(Content).count() == 50
+    many = {path: count_queries(client, path) for path in PATHS}
+
+    assert few == many
@@ -0,0 +1,273 @@
+import glob
+import gzip
+import math
+import os
+import tempfile
+from datetime import datetime
+from flask import Blueprint, Response, abort, current_app, jsonify, request, url_for
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Content, AppState, TileVersion
+from spatial import filter_bbox
+
+tiles_bp = Blueprint('tiles', __name__)
+
+LAYER_NAME = 'contents'
+MVT_MIMETYPE = 'application/vnd.mapbox-vector-tile'
+
+# Versão a partir da qual todos os tiles estão desatualizados (ex.: importação em massa)
+TILES_RESET_KEY = 'tiles_reset'
+
+# Latitude máxima da projeção Web Mercator
+MAX_LATITUDE = 85.0511287798
+
+
+# Projeção Web Mercator (coordenadas "mundo": 0..2^z em x e y)
+
+def lonlat_to_world(lat, lon, z):
+    """Posição do ponto em unidades de tile no zoom z"""
+    n = 2 ** z
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+
+def world_to_lonlat(x, y, z):
+    """Inverso de lonlat_to_world: (lon, lat)"""
+    n = 2 ** z
+    lon = x / n * 360.0 - 180.0
+    lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    return lon, lat
+
+
+def tile_bbox(z, x, y, margin=0.0):
+    """Caixa (minLon, minLat, maxLon, maxLat) do tile, alargada por margin (fração do tile)"""
+    n = 2 ** z
+    min_lon, max_lat = world_to_lonlat(max(0.0, x - margin), max(0.0, y - margin), z)
+    max_lon, min_lat = world_to_lonlat(min(n, x + 1 + margin), min(n, y + 1 + margin), z)
+    return min_lon, min_lat, max_lon, max_lat
+
+
+def tiles_for_point(lat, lon, z, margin=0.0):
+    """Tiles (x, y) do zoom z que incluem o ponto, contando com a margem"""
+    n = 2 ** z
+    wx, wy = lonlat_to_world(lat, lon, z)
+    tiles = set()
+    for x in range(int(wx) - 1, int(wx) + 2):
+        for y in range(int(wy) - 1, int(wy) + 2):
+            if 0 <= x < n and 0 <= y < n and x - margin <= wx < x + 1 + margin \
+                    and y - margin <= wy < y + 1 + margin:
+                tiles.add((x, y))
+    return tiles
+
+
+# Codificação Mapbox Vector Tile (protobuf, especificação 2.1)
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def _field(number, payload):
+    """Campo length-delimited (tipo 2)"""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _uint_field(number, value):
+    """Campo varint (tipo 0)"""
+    return _varint(number << 3) + _varint(value)
+
+
+def _packed(number, values):
+    return _field(number, b''.join(_varint(v) for v in values))
+
+
+def encode_tile(features, extent):
+    """Tile com uma camada de pontos: features = [(id, px, py, {propriedade: valor})]"""
+    if not features:
+        return b''
+
+    keys, values = {}, {}
+    encoded = []
+    for feature_id, px, py, properties in features:
+        tags = []
+        for key, value in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+        geometry = (9, _zigzag(px), _zigzag(py))  # MoveTo(1) + ponto
+        encoded.append(_field(2, _uint_field(1, feature_id) + _packed(2, tags)
+                              + _uint_field(3, 1) + _packed(4, geometry)))
+
+    layer = [_uint_field(15, 2), _field(1, LAYER_NAME.encode())]
+    layer.extend(encoded)
+    layer.extend(_field(3, key.encode()) for key in keys)
+    for kind, value in values:
+        if kind is str:
+            layer.append(_field(4, _field(1, value.encode())))
+        else:
+            layer.append(_field(4, _uint_field(5, value)))  # uint_value
+    layer.append(_uint_field(5, extent))
+    return _field(3, b''.join(layer))
+
+
+# Versões e invalidação
+
+def tile_version(z, x, y):
+    """Versão atual do tile (só muda quando uma escrita lhe toca)"""
+    version = db.session.query(TileVersion.version).filter_by(z=z, x=x, y=y).scalar() or 0
+    reset = db.session.get(AppState, TILES_RESET_KEY)
+    return max(version, reset.value if reset else 0)
+
+
+def touch_tiles(version, *points):
+    """Marcar os tiles que incluem os pontos (lat, lon) como alterados (antes do commit)"""
+    config = current_app.config
+    margin = config['TILE_BUFFER'] / config['TILE_EXTENT']
+    rows = {}
+    for point in points:
+        if not point or point[0] is None or point[1] is None \
+                or not (math.isfinite(point[0]) and math.isfinite(point[1])):
+            continue
+        for z in range(config['TILE_MAX_ZOOM'] + 1):
+            for x, y in tiles_for_point(point[0], point[1], z, margin):
+                rows[(z, x, y)] = {'z': z, 'x': x, 'y': y, 'version': version}
+    if not rows:
+        return
+
+    dialect = db.engine.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = (sqlite if dialect == 'sqlite' else postgresql).insert
+        statement = insert(TileVersion)
+        statement = statement.on_conflict_do_update(
+            index_elements=['z', 'x', 'y'], set_={'version': statement.excluded.version})
+        db.session.execute(statement, list(rows.values()))
+    else:
+        for row in rows.values():
+            db.session.merge(TileVersion(**row))
+
+
+def reset_tiles(version):
+    """Invalidar todos os tiles (escritas em massa; antes do commit)"""
+    state = db.session.get(AppState, TILES_RESET_KEY)
+    if state is None:
+        db.session.add(AppState(key=TILES_RESET_KEY, value=version, updated_at=datetime.utcnow()))
+    else:
+        state.value = version
+        state.updated_at = datetime.utcnow()
+
+
+# Geração e cache em disco
+
+def build_tile(z, x, y):
+    """Gerar o tile a partir das colunas de coordenadas (pontos agrupados por célula e categoria)"""
+    config = current_app.config
+    extent = config['TILE_EXTENT']
+    buffer = config['TILE_BUFFER']
+    cell = config['TILE_CELL']
+
+    query = db.session.query(Content.id, Content.latitude, Content.longitude, Content.category, Content.title)
+    query = filter_bbox(query, tile_bbox(z, x, y, buffer / extent))
+    rows = query.order_by(Content.id.desc()).all()
+
+    # Em zooms baixos muitos pontos caem no mesmo píxel: fica o mais recente, com a contagem
+    cells = {}
+    for content_id, lat, lon, category, title in rows:
+        wx, wy = lonlat_to_world(lat, lon, z)
+        px, py = round((wx - x) * extent), round((wy - y) * extent)
+        if not (-buffer <= px < extent + buffer and -buffer <= py < extent + buffer):
+            continue
+        key = (px // cell, py // cell, category)
+        if key in cells:
+            cells[key][3]['count'] = cells[key][3].get('count', 1) + 1
+        else:
+            cells[key] = (content_id, px, py, {'category': category, 'title': title})
+    return encode_tile(list(cells.values()), extent)
+
+
+def cached_tile(z, x, y, version):
+    """Tile comprimido (gzip), lido do disco ou gerado e guardado para esta versão"""
+    folder = os.path.join(current_app.config['TILE_CACHE_FOLDER'], str(z), str(x))
+    path = os.path.join(folder, f'{y}.{version}.pbf.gz')
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        pass
+
+    data = gzip.compress(build_tile(z, x, y), compresslevel=6, mtime=0)
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.tmp-')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    # Versões anteriores deste tile já não são usadas
+    for old in glob.glob(os.path.join(folder, f'{y}.*.pbf.gz')):
+        if old != path:
+            try:
+                os.remove(old)
+            except FileNotFoundError:
+                pass
+    return data
+
+
+@tiles_bp.route('/tiles/contents/<int:z>/<int:x>/<int:y>.pbf')
+def content_tile(z, x, y):
+    """Tile vetorial (Mapbox Vector Tile) com os conteúdos: id, categoria e título"""
+    config = current_app.config
+    if z > config['TILE_MAX_ZOOM'] or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        abort(404)
+
+    version = tile_version(z, x, y)
+    data = cached_tile(z, x, y, version)
+    etag = f'{z}-{x}-{y}-{version}'
+
+    if request.accept_encodings['gzip']:
+        response = Response(data, mimetype=MVT_MIMETYPE)
+        response.content_encoding = 'gzip'
+        response.set_etag(etag + '-gz')
+    else:
+        response = Response(gzip.decompress(data), mimetype=MVT_MIMETYPE)
+        response.set_etag(etag)
+
+    response.vary.add('Accept-Encoding')
+    response.cache_control.public = True
+    response.cache_control.max_age = config['TILE_MAX_AGE']
+    return response.make_conditional(request)
+
+
+@tiles_bp.route('/tiles/contents.json')
+def content_tilejson():
+    """Descrição TileJSON da camada (para MapLibre GL / Mapbox GL)"""
+    url = url_for('tiles.content_tile', z=0, x=0, y=0, _external=True)
+    template = url[:-len('0/0/0.pbf')] + '{z}/{x}/{y}.pbf'
+    bounds = db.session.query(
+        func.min(Content.longitude), func.min(Content.latitude),
+        func.max(Content.longitude), func.max(Content.latitude)
+    ).one()
+    return jsonify({
+        'tilejson': '3.0.0',
+        'name': LAYER_NAME,
+        'tiles': [template],
+        'minzoom': 0,
+        'maxzoom': current_app.config['TILE_MAX_ZOOM'],
+        'bounds': list(bounds) if None not in bounds else [-180, -85.0511, 180, 85.0511],
+        'vector_layers': [{
+            'id': LAYER_NAME,
+            'fields': {'category': 'String', 'title': 'String', 'count': 'Number'},
+            'minzoom': 0,
+            'maxzoom': current_app.config['TILE_MAX_ZOOM'],
+        }],
+    })
@@ -0,0 +1,205 @@
+import hashlib
+import os
+import secrets
+import shutil
+import time
+from datetime import datetime, timedelta
+from flask import Blueprint, request, jsonify, current_app
+from flask_login import login_required, current_user
+from models import db, ChunkedUpload
+from utils import allowed_file
+from media import place_blob, release_blob, delete_unused_media
+from metrics import observe_upload
+
+uploads_bp = Blueprint('uploads', __name__)
+
+
+def partial_path(upload_id):
+    """Caminho do ficheiro temporário de um upload por blocos"""
+    return os.path.join(current_app.config['CHUNKED_UPLOAD_FOLDER'], f'{upload_id}.part')
+
+
+def get_user_upload(upload_id):
+    """Obter um upload do utilizador atual (None se não existir)"""
+    return ChunkedUpload.query.filter_by(id=upload_id, user_id=current_user.id).first()
+
+
+@uploads_bp.route('/api/uploads', methods=['POST'])
+@login_required
+def init_upload():
+    """Iniciar um upload por blocos: {filename, size, sha256 (opcional)}"""
+    data = request.get_json(silent=True) or {}
+    filename = str(data.get('filename', '')).strip()
+    size = data.get('size')
+    sha256 = data.get('sha256')
+
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Tipo de ficheiro não permitido'}), 400
+
+    if not isinstance(size, int) or size <= 0:
+        return jsonify({'error': 'Tamanho inválido'}), 400
+
+    if size > current_app.config['CHUNKED_UPLOAD_MAX_SIZE']:
+        return jsonify({'error': 'Ficheiro demasiado grande'}), 413
+
+    if sha256 is not None and (not isinstance(sha256, str) or len(sha256) != 64):
+        return jsonify({'error': 'Checksum inválido'}), 400
+
+    upload = ChunkedUpload(
+        id=secrets.token_hex(16),
+        user_id=current_user.id,
+        filename=filename,
+        size=size,
+        sha256=sha256.lower() if sha256 else None
+    )
+
+    # Criar já o ficheiro vazio onde os blocos vão ser escritos
+    os.makedirs(current_app.config['CHUNKED_UPLOAD_FOLDER'], exist_ok=True)
+    open(partial_path(upload.id), 'wb').close()
+
+    db.session.add(upload)
+    db.session.commit()
+
+    result = upload.to_dict()
+    result['chunk_size'] = current_app.config['CHUNKED_UPLOAD_CHUNK_SIZE']
+    return jsonify(result), 201
+
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['GET'])
+@login_required
+def upload_status(upload_id):
+    """Estado de um upload (o offset indica onde retomar)"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload não encontrado'}), 404
+    return jsonify(upload.to_dict())
+
+
+@uploads_bp.route('/api/uploads/<upload_id>', methods=['PUT'])
+@login_required
+def upload_chunk(upload_id):
+    """Receber um bloco (?offset=N) e escrevê-lo diretamente no ficheiro temporário"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload não encontrado'}), 404
+
+    if upload.status != 'uploading':
+        return jsonify({'error': 'Upload já finalizado'}), 409
+
+    offset = request.args.get('offset', type=int)
+    length = request.content_length
+
+    # O cliente tem de continuar exatamente onde o servidor ficou
+    if offset != upload.offset:
+        return jsonify({'error': 'Offset inválido', 'offset': upload.offset}), 409
+
+    if not length or offset + length > upload.size:
+        return jsonify({'error': 'Bloco inválido', 'offset': upload.offset}), 400
+
+    # Ler o corpo em blocos (memória limitada, sem passar pelo parser de formulários)
+    # para um ficheiro só deste pedido: o .part só muda depois de o offset ser reservado
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
+    started = time.perf_counter()
+    written = 0
+    chunk_path = f'{partial_path(upload.id)}.{secrets.token_hex(4)}.chunk'
+    try:
+        with open(chunk_path, 'wb') as tmp:
+            while written < length:
+                chunk = request.stream.read(min(chunk_size, length - written))
+                if not chunk:
+                    break
+                tmp.write(chunk)
+                written += len(chunk)
+        observe_upload('chunked', written, started)
+
+        # UPDATE condicional: dois PUTs no mesmo offset (ex.: repetição após timeout) não
+        # avançam ambos; o bloqueio da linha dura até ao commit, depois de o bloco ser escrito
+        updated = ChunkedUpload.query.filter_by(id=upload.id, offset=offset).update(
+            {ChunkedUpload.offset: offset + written}, synchronize_session=False)
+        if not updated:
+            db.session.rollback()
+            return jsonify({'error': 'Offset inválido', 'offset': get_user_upload(upload_id).offset}), 409
+
+        try:
+            with open(chunk_path, 'rb') as tmp, open(partial_path(upload.id), 'r+b') as part:
+                part.seek(offset)
+                shutil.copyfileobj(tmp, part, chunk_size)
+                # Descartar bytes de uma tentativa anterior interrompida a meio
+                part.truncate(offset + written)
+        except OSError:
+            db.session.rollback()
+            raise
+        db.session.commit()
+    finally:
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+
+    return jsonify({'id': upload.id, 'offset': offset + written, 'size': upload.size})
+
+
+@uploads_bp.route('/api/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+def finalize_upload(upload_id):
+    """Verificar o checksum e mover o ficheiro para o armazenamento definitivo"""
+    upload = get_user_upload(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload não encontrado'}), 404
+
+    if upload.status != 'uploading':
+        return jsonify(upload.to_dict())
+
+    if upload.offset != upload.size:
+        return jsonify({'error': 'Upload incompleto', 'offset': upload.offset}), 409
+
+    data = request.get_json(silent=True) or {}
+    expected = (data.get('sha256') or upload.sha256 or '').lower()
+
+    # Calcular o SHA-256 lendo o ficheiro por blocos
+    digest = hashlib.sha256()
+    path = partial_path(upload.id)
+    with open(path, 'rb') as part:
+        for chunk in iter(lambda: part.read(current_app.config['UPLOAD_CHUNK_SIZE']), b''):
+            digest.update(chunk)
+
+    if expected and digest.hexdigest() != expected:
+        return jsonify({'error': 'Checksum não corresponde'}), 422
+
+    # O upload fica com uma referência ao ficheiro até ser associado a um conteúdo
+    ext = upload.filename.rsplit('.', 1)[1].lower()
+    upload.media_filename = place_blob(path, digest.hexdigest(), ext)
+    upload.status = 'complete'
+    db.session.commit()
+
+    return jsonify(upload.to_dict())
+
+
+def claim_upload(upload_id, user_id):
+    """Associar um upload finalizado a um conteúdo (devolve o ficheiro ou None)
+
+    A referência registada no finalize passa para o conteúdo.
+    """
+    claimed = ChunkedUpload.query.filter_by(id=upload_id, user_id=user_id, status='complete')\
+        .update({ChunkedUpload.status: 'attached'}, synchronize_session=False)
+    if not claimed:
+        return None
+    return db.session.query(ChunkedUpload.media_filename).filter_by(id=upload_id).scalar()
+
+
+def purge_expired_uploads():
+    """Apagar uploads por blocos abandonados (e os ficheiros temporários)"""
+    limit = datetime.utcnow() - timedelta(seconds=current_app.config['CHUNKED_UPLOAD_EXPIRATION'])
+    expired = ChunkedUpload.query.filter(ChunkedUpload.created_at < limit).all()
+    for upload in expired:
+        path = partial_path(upload.id)
+        if os.path.exists(path):
+            os.remove(path)
+        if upload.status == 'complete':
+            release_blob(upload.media_filename)
+        db.session.delete(upload)
+    db.session.commit()
+
+    # Ficheiros finalizados mas nunca associados a um conteúdo
+    for upload in expired:
+        if upload.status == 'complete':
+            delete_unused_media(upload.media_filename)
+    return len(expired)
@@ -0,0 +1,78 @@
+import os
+import time
+from flask import current_app
+from flask_login import UserMixin
+from models import db, User
+from cache import TTLCache
+
+
+class CachedUser(UserMixin):
+    """Cópia compacta e só de leitura de um utilizador (para o current_user)"""
+
+    __slots__ = ('id', 'username', 'is_validated')
+
+    def __init__(self, id, username, is_validated):
+        self.id = id
+        self.username = username
+        self.is_validated = is_validated
+
+    def __repr__(self):
+        return f'<CachedUser {self.username}>'
+
+
+class UserCache:
+    """Utilizadores por id, partilhados entre pedidos do mesmo processo
+
+    Alterações às contas atualizam um ficheiro de versão (ver bump); os outros
+    processos comparam a data desse ficheiro e descartam a cache se mudou.
+    """
+
+    def __init__(self):
+        self.cache = None  # criada no primeiro pedido
+        self.version = None
+
+    def _version_path(self):
+        return current_app.config['USER_CACHE_VERSION_FILE']
+
+    def current_version(self):
+        """Versão partilhada das contas (data de modificação do ficheiro de versão)"""
+        try:
+            return os.stat(self._version_path()).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def get(self, user_id):
+        """Obter o utilizador (da cache ou da base de dados); None se não existir"""
+        if self.cache is None:
+            config = current_app.config
+            self.cache = TTLCache(config['USER_CACHE_SIZE'], config['USER_CACHE_TTL'])
+
+        version = self.current_version()
+        if version != self.version:
+            self.cache.clear()
+            self.version = version
+
+        user = self.cache.get(user_id)
+        if user is not None:
+            return user
+
+        row = db.session.query(User.id, User.username, User.is_validated).filter_by(id=user_id).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        self.cache.set(user_id, user)
+        return user
+
+    def bump(self):
+        """Invalidar a cache em todos os processos (chamar depois do commit)"""
+        path = self._version_path()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'a'):
+            pass
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+        if self.cache is not None:
+            self.cache.clear()
+
+
+user_cache = UserCache()
@@ -1,12 +1,11 @@
+import math
 import os
 import secrets
-from datetime import datetime, timedelta
-from werkzeug.utils import secure_filename
+import time
 from flask import current_app
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
 from itsdangerous import URLSafeTimedSerializer
+from media import store_blob, upload_path
+from metrics import observe_upload
 
 def generate_token():
     """Gerar token seguro para validação"""
@@ -30,90 +29,19 @@ def verify_validation_token(token, max_age=86400):
     except:
         return None
 
-def send_validation_email(user_email, username, validation_token):
-    """Enviar email de validação"""
-    try:
-        # Configurações SMTP
-        smtp_server = current_app.config['SMTP_SERVER']
-        smtp_port = current_app.config['SMTP_PORT']
-        sender_email = current_app.config['SMTP_EMAIL']
-        sender_password = current_app.config['SMTP_PASSWORD']
-        app_url = current_app.config['APP_URL']
-        
-        if not sender_email or not sender_password:
-            print("AVISO: Configurações SMTP não definidas. Email não enviado.")
-            return False
-        
-        # Link de validação
-        validation_link = f"{app_url}/validate/{validation_token}"
-        
-        # Criar mensagem
-        message = MIMEMultipart("alternative")
-        message["Subject"] = "Discover Lisboa - Validação de Conta"
-        message["From"] = sender_email
-        message["To"] = user_email
-        
-        # Corpo do email em HTML
-        html = f"""
-        <html>
-            <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
-                    <h2 style="color: #2c3e50;">Bem-vindo ao Discover Lisboa!</h2>
-                    <p>Olá <strong>{username}</strong>,</p>
-                    <p>Obrigado por te registares no Discover Lisboa, o teu guia turístico interativo de Lisboa.</p>
-                    <p>Para completar o teu registo, clica no botão abaixo para validar o teu email:</p>
-                    <div style="text-align: center; margin: 30px 0;">
-                        <a href="{validation_link}" 
-                           style="background-color: #3498db; color: white; padding: 12px 30px; 
-                                  text-decoration: none; border-radius: 5px; display: inline-block;">
-                            Validar Email
-                        </a>
-                    </div>
-                    <p style="font-size: 12px; color: #7f8c8d;">
-                        Ou copia e cola este link no teu navegador:<br>
-                        <a href="{validation_link}">{validation_link}</a>
-                    </p>
-                    <p style="font-size: 12px; color: #7f8c8d;">
-                        Este link expira em 24 horas.
-                    </p>
-                    <hr style="border: none; border-top: 1px solid #ecf0f1; margin: 20px 0;">
-                    <p style="font-size: 11px; color: #95a5a6;">
-                        Se não te registaste no Discover Lisboa, ignora este email.
-                    </p>
-                </div>
-            </body>
-        </html>
-        """
-        
-        message.attach(MIMEText(html, "html"))
-        
-        # Enviar email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)
-            server.sendmail(sender_email, user_email, message.as_string())
-        
-        print(f"Email de validação enviado para: {user_email}")
-        return True
-        
-    except Exception as e:
-        print(f"Erro ao enviar email: {e}")
-        return False
-
 def allowed_file(filename):
     """Verificar se a extensão do ficheiro é permitida"""
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
 
 def save_uploaded_file(file):
-    """Guardar ficheiro carregado"""
+    """Guardar ficheiro carregado (endereçado pelo conteúdo: ab/cd/<sha256>.<ext>)"""
     if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        # Adicionar timestamp para evitar colisões
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{filename}"
-        filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        ext = file.filename.rsplit('.', 1)[1].lower()
+        started = time.perf_counter()
+        # Ficheiros iguais ficam guardados uma única vez
+        filename = store_blob(file.stream, ext)
+        observe_upload('form', os.path.getsize(upload_path(filename)), started)
         return filename
     return None
 
@@ -129,3 +57,16 @@ def get_media_type(filename):
     elif ext in {'mp3', 'wav'}:
         return 'audio'
     return None
+
+def parse_coordinates(latitude, longitude):
+    """Converter as coordenadas do formulário: (lat, lon), (None, None) se vazias ou None se inválidas"""
+    if not latitude and not longitude:
+        return None, None
+    try:
+        lat, lon = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    # float() aceita 'nan' e 'inf'
+    if not (math.isfinite(lat) and math.isfinite(lon) and -90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
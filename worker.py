@@ -0,0 +1,97 @@
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from app import app, db
+from jobs import claim_job, run_job, recover_stale_jobs, release_worker_jobs
+from uploads import purge_expired_uploads
+
+running = True
+
+
+def stop(signum, frame):
+    """Terminar depois da tarefa atual"""
+    global running
+    running = False
+
+
+def make_worker_id(pid, index):
+    """Identificador do worker guardado nas tarefas que reserva"""
+    return f'{socket.gethostname()}:{pid}:{index}'
+
+
+def worker_loop(index):
+    """Processo worker: reservar e executar tarefas da fila até ser parado"""
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    worker_id = make_worker_id(os.getpid(), index)
+
+    with app.app_context():
+        # Não reutilizar as ligações à base de dados herdadas do processo pai
+        db.engine.dispose(close=False)
+        poll_interval = app.config['WORKER_POLL_INTERVAL']
+
+        while running:
+            job = claim_job(worker_id)
+            if job is None:
+                db.session.remove()
+                time.sleep(poll_interval)
+                continue
+            run_job(job)
+            db.session.remove()
+
+
+def start_worker(index):
+    """Iniciar um processo worker"""
+    process = multiprocessing.Process(target=worker_loop, args=(index,), name=f'media-worker-{index}')
+    process.start()
+    return process
+
+
+def main():
+    """Executar o pool de workers de processamento de média"""
+    parser = argparse.ArgumentParser(description='Workers de processamento de média do Discover Lisboa')
+    parser.add_argument('-p', '--processes', type=int, default=app.config['WORKER_PROCESSES'],
+                        help='número de processos worker')
+    args = parser.parse_args()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    with app.app_context():
+        recovered = recover_stale_jobs()
+        if recovered:
+            print(f"{recovered} tarefa(s) interrompida(s) devolvida(s) à fila")
+
+    processes = [start_worker(i) for i in range(args.processes)]
+    print(f"{len(processes)} worker(s) a processar a fila de média. Ctrl+C para terminar.")
+
+    last_recovery = time.time()
+    while running:
+        time.sleep(1)
+
+        # Substituir workers que terminaram inesperadamente
+        for i, process in enumerate(processes):
+            if not process.is_alive():
+                print(f"Worker {process.name} terminou (código {process.exitcode}). A reiniciar...")
+                with app.app_context():
+                    release_worker_jobs(make_worker_id(process.pid, i))
+                processes[i] = start_worker(i)
+
+        # Recuperar periodicamente tarefas presas e limpar uploads abandonados
+        if time.time() - last_recovery > 60:
+            with app.app_context():
+                recover_stale_jobs()
+                purge_expired_uploads()
+            last_recovery = time.time()
+
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+if __name__ == '__main__':
+    main()